@@ -0,0 +1,306 @@
+'''
+Benchmarks de los endpoints más usados de flaskr.
+
+    python benchmarks/bench.py --posts 100000 --users 1000 -o result.json
+    python benchmarks/bench.py --posts 100000 --baseline baseline.json
+
+Crea la app con create_app(test_config) igual que tests/conftest.py, sobre
+una base de datos temporal con schema.sql y tests/data.sql, y la llena con
+--posts posts repartidos entre --users usuarios. Después lanza --requests
+peticiones por escenario con el cliente de pruebas de Flask o, con --server,
+contra un servidor WSGI local con --concurrency clientes a la vez.
+
+Para cada escenario guarda peticiones por segundo, latencias p50/p95/p99
+(ms) y el pico de memoria. Con --baseline compara con un resultado anterior
+y termina con código 1 si algún escenario empeora más de --tolerance.
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flaskr import create_app
+from flaskr.db import get_db, get_pools, init_db
+
+SEED_BATCH = 10000
+# peticiones de la pasada con tracemalloc
+MEMORY_SAMPLES = 20
+
+def seed(app, posts, users):
+    '''schema.sql + tests/data.sql y después los usuarios y posts pedidos.'''
+    with open(os.path.join(ROOT, 'tests', 'data.sql'), encoding='utf8') as f:
+        data_sql = f.read()
+
+    with app.app_context():
+        init_db()
+        db = get_db()
+        db.executescript(data_sql)
+        password = db.execute('SELECT password FROM user WHERE id = 1').fetchone()[0]
+        db.executemany(
+            'INSERT INTO user (username, password) VALUES (?, ?)',
+            ((f'user{i}', password) for i in range(users))
+        )
+        user_count = db.execute('SELECT COUNT(*) FROM user').fetchone()[0]
+
+        rng = random.Random(0)
+        start = 1546300800 # 2019-01-01
+        for offset in range(0, posts, SEED_BATCH):
+            db.executemany(
+                'INSERT INTO post (title, body, author_id, created)'
+                " VALUES (?, ?, ?, datetime(?, 'unixepoch'))",
+                (
+                    (f'post {i}', f'cuerpo del post {i} ' * 10,
+                     rng.randint(1, user_count), start + i * 60)
+                    for i in range(offset, min(offset + SEED_BATCH, posts))
+                )
+            )
+            db.commit()
+        db.execute('ANALYZE')
+        db.commit()
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+def summarize(latencies, elapsed, peak_memory):
+    return {
+        'requests': len(latencies),
+        'req_per_s': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'peak_memory_kb': peak_memory // 1024,
+    }
+
+def scenarios(app, client):
+    '''
+    Cada escenario es (nombre, función que hace una petición, status
+    esperado). Los que necesitan usuario usan una sesión con user_id como en
+    los tests.
+    '''
+    with app.app_context():
+        db = get_db()
+        oldest = db.execute(
+            'SELECT created, id FROM post ORDER BY created, id LIMIT 1 OFFSET 50'
+        ).fetchone()
+        post_id = db.execute(
+            'SELECT id FROM post WHERE author_id = 1 ORDER BY id DESC LIMIT 1'
+        ).fetchone()[0]
+    deep_cursor = f'{oldest[0]},{oldest[1]}' if oldest else None
+    counter = iter(range(10 ** 9))
+
+    def login():
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+
+    def anonymous(path):
+        def request():
+            with client.session_transaction() as sess:
+                sess.clear()
+            return client.get(path)
+        return request
+
+    def logged_in(method, path, data=None):
+        def request():
+            login()
+            return client.open(path, method=method, data=data)
+        return request
+
+    def create():
+        login()
+        return client.post('/create', data={
+            'title': f'bench {next(counter)}', 'content': 'cuerpo'
+        })
+
+    yield 'index', anonymous('/'), 200
+    if deep_cursor:
+        yield 'index_deep_page', anonymous(f'/?before={deep_cursor}'), 200
+    yield 'index_logged_in', logged_in('GET', '/'), 200
+    yield 'get_post', logged_in('GET', f'/{post_id}/update'), 200
+    yield 'login', anonymous('/auth/login'), 200
+    yield 'login_post', logged_in('POST', '/auth/login', {
+        'email': 'test', 'password': 'test'
+    }), 302
+    yield 'search', anonymous('/search?q=post'), 200
+    yield 'api_posts', anonymous('/api/posts?fields=id,title'), 200
+    yield 'create_post', create, 302
+
+def peak_memory(function, times):
+    '''
+    Pico de memoria reservada por Python al repetir function. Se mide en una
+    pasada aparte porque tracemalloc hace mucho más lentas las peticiones.
+    '''
+    tracemalloc.start()
+    try:
+        for _ in range(times):
+            function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_client(app, requests):
+    results = {}
+    client = app.test_client()
+    for name, request, status in scenarios(app, client):
+        request() # calienta cachés y conexiones
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            response = request()
+            latencies.append(time.perf_counter() - t0)
+            # un 429 o un 302 al login también es rápido, pero no es lo que se mide
+            if response.status_code != status:
+                raise RuntimeError(
+                    f'{name}: status {response.status_code}, se esperaba {status}'
+                )
+        elapsed = time.perf_counter() - start
+        peak = peak_memory(request, min(requests, MEMORY_SAMPLES))
+        results[name] = summarize(latencies, elapsed, peak)
+        print(f"{name:18} {results[name]['req_per_s']:>9} req/s"
+              f"  p95 {results[name]['p95_ms']} ms", file=sys.stderr)
+    return results
+
+def run_server(app, requests, concurrency):
+    '''Peticiones GET anónimas contra un servidor WSGI local con varios hilos.'''
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server(
+        '127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{server.server_port}'
+
+    def fetch(path):
+        t0 = time.perf_counter()
+        with urllib.request.urlopen(base + path) as response:
+            response.read()
+        return time.perf_counter() - t0
+
+    results = {}
+    try:
+        for name, path in (
+            ('server_index', '/'),
+            ('server_search', '/search?q=post'),
+            ('server_api_posts', '/api/posts'),
+        ):
+            fetch(path)
+            start = time.perf_counter()
+            with ThreadPoolExecutor(concurrency) as pool:
+                latencies = list(pool.map(fetch, [path] * requests))
+            elapsed = time.perf_counter() - start
+            peak = peak_memory(lambda: fetch(path), min(requests, MEMORY_SAMPLES))
+            results[name] = summarize(latencies, elapsed, peak)
+            print(f"{name:18} {results[name]['req_per_s']:>9} req/s"
+                  f"  p95 {results[name]['p95_ms']} ms", file=sys.stderr)
+    finally:
+        server.shutdown()
+    return results
+
+def compare(results, baseline, tolerance):
+    '''Escenarios con menos req/s o más p95 que la línea base (más la tolerancia).'''
+    regressions = []
+    for name, result in results['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        if result['req_per_s'] < base['req_per_s'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['req_per_s']} req/s (antes {base['req_per_s']})"
+            )
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {result['p95_ms']} ms (antes {base['p95_ms']})"
+            )
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='peticiones por escenario')
+    parser.add_argument('--server', action='store_true',
+                        help='medir también contra un servidor WSGI local')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('-o', '--output', help='fichero JSON de resultados')
+    parser.add_argument('--baseline', help='resultado anterior con el que comparar')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    try:
+        app = create_app({
+            'TESTING': True,
+            'DATABASE': path,
+            'WTF_CSRF_ENABLED': False,
+            'SLOW_QUERY_MS': None,
+            # login_post repite el mismo login: mide el hash, no el límite
+            'RATELIMIT_ENABLED': False,
+        })
+        start = time.perf_counter()
+        seed(app, args.posts, args.users)
+        print(f'datos creados en {time.perf_counter() - start:.1f} s', file=sys.stderr)
+
+        results = {
+            'config': {
+                'posts': args.posts, 'users': args.users,
+                'requests': args.requests, 'concurrency': args.concurrency,
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'machine': platform.machine(),
+            },
+            'scenarios': run_client(app, args.requests),
+        }
+        if args.server:
+            results['scenarios'].update(
+                run_server(app, args.requests, args.concurrency)
+            )
+        results['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        app.extensions['flaskr.clicks'].stop()
+        for pool in get_pools(app).values():
+            pool.close_all()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESIÓN', regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,7 +9,7 @@ from flask import Flask
 
 from flask_login import LoginManager
 
-from flaskr.models import users
+from flaskr.models import SqliteUserRegistry, users
 
 def create_app(test_config=None):
 
@@ -28,6 +28,13 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE=os.path.join(app.instance_path, 'flaskr.sqlite'),
+        # número de posts por página en las listas paginadas por cursor
+        POSTS_PER_PAGE=20,
+        # 'memory' usa el registro global models.users, 'sqlite' lee de la
+        # tabla user los usuarios que no tiene en memoria
+        USER_REGISTRY='memory',
+        # usuarios que el registro 'sqlite' guarda en memoria
+        USER_REGISTRY_CACHE_SIZE=1024,
     )
 
     login_manager = LoginManager(app)
@@ -49,21 +56,52 @@ def create_app(test_config=None):
     def hello():
         return 'hola mundo!'
     
+    if app.config['USER_REGISTRY'] == 'sqlite':
+        registry = SqliteUserRegistry(app.config['USER_REGISTRY_CACHE_SIZE'])
+    else:
+        registry = users
+    app.extensions['flaskr.users'] = registry
+
     @login_manager.user_loader
     def load_user(user_id):
-        for user in users:
-            if user.id == int(user_id):
-                return user
-        return None
+        try:
+            return registry.get(int(user_id))
+        except ValueError:
+            return None
     
+    from . import metrics
+    metrics.init_app(app)
+
     from . import db
     db.init_app(app)
 
+    from . import hashing
+    hashing.init_app(app)
+
+    from . import writer
+    writer.init_app(app)
+
+    from . import ratelimit
+    ratelimit.init_app(app)
+
     from . import auth
-    app.register_blueprint(auth.bp)
+    auth.init_app(app)
 
     from . import blog
-    app.register_blueprint(blog.bp)
+    blog.init_app(app)
     app.add_url_rule('/', endpoint='index')
+
+    from . import enlaces
+    enlaces.init_app(app)
+
+    # registra también, sin importarlas, las órdenes de bulk y metadata
+    from . import startup
+    startup.init_app(app)
+
+    from . import api
+    api.init_app(app)
+
+    from . import assets
+    assets.init_app(app)
     
     return app
\ No newline at end of file
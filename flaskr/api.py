@@ -0,0 +1,104 @@
+'''
+API de solo lectura para integraciones.
+- /api/posts devuelve una página JSON de posts paginada por cursor, igual
+que el index (?before= / ?after=, ?per_page=).
+- /api/posts.ndjson devuelve todos los posts, uno por línea, en streaming:
+el generador va leyendo el cursor de sqlite por bloques mientras se envía
+la respuesta, así que la memoria no crece con la tabla y los primeros
+bytes salen enseguida.
+Las dos aceptan ?fields=id,title para no leer ni enviar los cuerpos.
+'''
+import json
+
+from flask import (
+    Blueprint, Response, abort, current_app, jsonify, request,
+    stream_with_context
+)
+from werkzeug.exceptions import HTTPException
+
+from flaskr.blog import cursor_args, keyset_page
+from flaskr.db import get_read_db, iter_rows
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+# campo -> expresión SQL
+POST_FIELDS = {
+    'id': 'p.id',
+    'title': 'p.title',
+    'body': 'p.body',
+    'excerpt': 'p.excerpt',
+    'created': 'p.created',
+    'author_id': 'p.author_id',
+    'username': 'u.username',
+}
+
+MAX_PER_PAGE = 100
+
+def requested_fields():
+    value = request.args.get('fields')
+    if not value:
+        return list(POST_FIELDS)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = set(fields) - set(POST_FIELDS)
+    if unknown or not fields:
+        abort(400, f"campos no válidos: {', '.join(sorted(unknown)) or value}")
+    return fields
+
+def post_select(fields):
+    '''
+    SELECT con solo los campos pedidos (más id y created, que hacen falta
+    para el cursor). La tabla user solo se une si se pide username.
+    '''
+    columns = dict.fromkeys(['id', 'created'] + fields)
+    sql = 'SELECT ' + ', '.join(f'{POST_FIELDS[f]} AS {f}' for f in columns)
+    sql += ' FROM post p'
+    if 'username' in columns:
+        sql += ' JOIN user u ON p.author_id = u.id'
+    return sql
+
+def post_json(row, fields):
+    post = {}
+    for field in fields:
+        value = row[field]
+        if field == 'created':
+            value = value.isoformat(sep=' ')
+        post[field] = value
+    return post
+
+@bp.route('/posts')
+def posts():
+    fields = requested_fields()
+    before, after = cursor_args()
+    per_page = request.args.get(
+        'per_page', current_app.config['POSTS_PER_PAGE'], type=int
+    )
+    if not 1 <= per_page <= MAX_PER_PAGE:
+        abort(400, f'per_page tiene que estar entre 1 y {MAX_PER_PAGE}.')
+
+    rows, prev_cursor, next_cursor = keyset_page(
+        post_select(fields), 'p', before=before, after=after, per_page=per_page
+    )
+    return jsonify(
+        posts=[post_json(row, fields) for row in rows],
+        prev=prev_cursor,
+        next=next_cursor,
+    )
+
+@bp.route('/posts.ndjson')
+def posts_ndjson():
+    fields = requested_fields()
+    sql = post_select(fields) + ' ORDER BY p.id'
+
+    @stream_with_context
+    def generate():
+        for row in iter_rows(get_read_db().execute(sql)):
+            yield json.dumps(post_json(row, fields), ensure_ascii=False) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+@bp.errorhandler(HTTPException)
+def json_error(e):
+    return jsonify(error=e.description), e.code
+
+def init_app(app):
+    app.register_blueprint(bp)
@@ -0,0 +1,211 @@
+'''
+Ficheros estáticos con huella y compresión de las respuestas.
+
+    flask build-static
+
+copia cada fichero de flaskr/static a ASSETS_BUILD_DIR con el hash del
+contenido en el nombre (style.css -> style.3f2a9c0b1d4e.css), junto con
+versiones ya comprimidas (.gz y, si está instalado el paquete brotli, .br),
+y escribe manifest.json con la correspondencia. A partir de ahí
+url_for('static', filename='style.css') devuelve el nombre con huella y ese
+fichero se sirve con Cache-Control immutable de un año: si cambia el
+contenido cambia la URL. Si no se ha ejecutado build-static todo funciona
+como antes, con los ficheros originales.
+
+Las respuestas dinámicas de texto (HTML, JSON...) de más de
+COMPRESS_MIN_SIZE bytes se comprimen al vuelo si el cliente lo acepta. Las
+respuestas en streaming no se tocan.
+'''
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST = 'manifest.json'
+
+# tipos que vale la pena comprimir (las imágenes y fuentes ya lo están)
+COMPRESSIBLE = {
+    'text/html', 'text/css', 'text/plain', 'text/xml', 'text/csv',
+    'text/javascript', 'application/javascript', 'application/json',
+    'application/xml', 'image/svg+xml',
+}
+
+def fingerprint(filename, content):
+    '''"css/style.css" -> "css/style.<12 primeros del sha256>.css".'''
+    root, ext = os.path.splitext(filename)
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f'{root}.{digest}{ext}'
+
+def _is_compressible(filename):
+    mimetype, encoding = mimetypes.guess_type(filename)
+    return encoding is None and mimetype in COMPRESSIBLE
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # se escribe en un temporal y se renombra para no servir ficheros a medias
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+def build_static(static_folder, build_dir):
+    '''Genera los ficheros con huella y el manifiesto. Devuelve el manifiesto.'''
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                content = f.read()
+
+            hashed = fingerprint(filename, content)
+            target = os.path.join(build_dir, hashed)
+            manifest[filename] = hashed
+            if os.path.exists(target):
+                continue
+            _write(target, content)
+            if _is_compressible(filename):
+                _write(target + '.gz', gzip.compress(content, 9, mtime=0))
+                if brotli is not None:
+                    _write(target + '.br', brotli.compress(content))
+
+    _write(
+        os.path.join(build_dir, MANIFEST),
+        json.dumps(manifest, indent=2, sort_keys=True).encode('utf8')
+    )
+    return manifest
+
+class Assets(object):
+    '''Manifiesto cargado en memoria y su inversa (nombre con huella -> original).'''
+
+    def __init__(self, build_dir):
+        self.build_dir = build_dir
+        self.load()
+
+    def load(self):
+        try:
+            with open(os.path.join(self.build_dir, MANIFEST), encoding='utf8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self.hashed = {hashed: name for name, hashed in self.manifest.items()}
+
+    def url_defaults(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = self.manifest.get(
+                values['filename'], values['filename']
+            )
+
+    def send_static(self, filename):
+        '''
+        Sustituye a la vista static de Flask: los nombres con huella salen
+        de build_dir, con la versión comprimida que acepte el cliente; el
+        resto, de la carpeta static como siempre.
+        '''
+        original = self.hashed.get(filename)
+        if original is None:
+            return current_app.send_static_file(filename)
+
+        mimetype = mimetypes.guess_type(original)[0]
+        served, encoding = filename, None
+        if _is_compressible(original):
+            accepted = request.accept_encodings
+            for candidate, ext in (('br', '.br'), ('gzip', '.gz')):
+                if accepted[candidate] and os.path.exists(
+                    os.path.join(self.build_dir, filename + ext)
+                ):
+                    served, encoding = filename + ext, candidate
+                    break
+
+        response = send_from_directory(
+            self.build_dir, served, mimetype=mimetype,
+            max_age=current_app.config['ASSETS_MAX_AGE']
+        )
+        if encoding is not None:
+            response.content_encoding = encoding
+        response.vary.add('Accept-Encoding')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+def get_assets():
+    return current_app.extensions['flaskr.assets']
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def compress_response(response):
+    '''after_request: comprime las respuestas de texto grandes.'''
+    config = current_app.config
+    min_size = config['COMPRESS_MIN_SIZE']
+    if (
+        min_size is None
+        or response.status_code != 200
+        or response.is_streamed
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding()
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+
+    if encoding == 'br':
+        data = brotli.compress(data, quality=config['COMPRESS_LEVEL'])
+    else:
+        data = gzip.compress(data, config['COMPRESS_LEVEL'])
+    response.set_data(data)
+    response.content_encoding = encoding
+    # el ETag fuerte identifica los bytes, que ya son otros
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(f'{etag}-{encoding}')
+    return response
+
+@click.command('build-static')
+@with_appcontext
+def build_static_command():
+    '''Genera los estáticos con huella y comprimidos en ASSETS_BUILD_DIR.'''
+    assets = get_assets()
+    manifest = build_static(current_app.static_folder, assets.build_dir)
+    assets.load()
+    click.echo(f'Generados {len(manifest)} ficheros en {assets.build_dir}')
+
+def init_app(app):
+    app.config.setdefault(
+        'ASSETS_BUILD_DIR', os.path.join(app.instance_path, 'static')
+    )
+    app.config.setdefault('ASSETS_MAX_AGE', 365 * 24 * 3600)
+    # None desactiva la compresión de las respuestas dinámicas
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    # nivel de gzip (1-9) o calidad de brotli (0-11)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+
+    assets = Assets(app.config['ASSETS_BUILD_DIR'])
+    app.extensions['flaskr.assets'] = assets
+    app.url_defaults(assets.url_defaults)
+    app.view_functions['static'] = assets.send_static
+    app.after_request(compress_response)
+    app.cli.add_command(build_static_command)
@@ -10,12 +10,15 @@ create_app())
 import functools
 
 from flask import ( 
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
+    Blueprint, current_app, flash, g, redirect, render_template, request,
+    session, url_for
 )
-from werkzeug.security import check_password_hash, generate_password_hash
-from werkzeug.urls import url_parse
+from flask_login import current_user
 
-from flaskr.db import get_db
+from flaskr.cache import LRUCache, get_cache, register_cache
+from flaskr.db import get_read_db, get_write_db
+from flaskr.hashing import check_password, get_hasher, hash_password
+from flaskr.ratelimit import rate_limited
 
 from flaskr.forms import SignupForm, LoginForm
 
@@ -27,6 +30,7 @@ from flaskr.forms import SignupForm, LoginForm
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 @bp.route('/register', methods=['GET','POST'])
+@rate_limited('register', account_field='email')
 def register():
     form = SignupForm()
     if form.validate_on_submit():
@@ -34,65 +38,89 @@ def register():
         email = form.email.data
         password = form.password.data
 
-        # tenc dubtes amb aquest next.
-        next = request.args.get('next', None)
-        if next:
-            return redirect(next)
-        return redirect(url_for('index'))
-    
+        db = get_write_db()
+        try:
+            db.execute(
+                'INSERT INTO user (username, email, password) VALUES (?, ?, ?)',
+                (username, email, hash_password(password))
+            )
+            db.commit()
+        except db.IntegrityError:
+            flash(f'El usuario {username} o el email {email} ya está registrado.')
+        else:
+            return redirect(url_for('auth.login'))
+
     return render_template('auth/register.html', form=form)
 
 @bp.route('/login', methods=['GET','POST'])
+@rate_limited('login', account_field='email')
 def login():
     if current_user.is_authenticated:
         return redirect(url_for('index'))
     form = LoginForm()
 
     if form.validate_on_submit():
-    # if request.method == 'POST':
-    #     username = request.form['username']
-    #     password = request.form['password']
-    #     db = get_db()
-    #     error = None
-    #     user = db.execute(
-    #         # "," després de username indica que és una tupla, si no
-    #         # se posa, dona error perque ho interpreta com una sola
-    #         # expresió, i interpretarà que estam passant es número de parámetres
-    #         # corresponent al numero de caracters que té es valor de sa variable 
-    #         'SELECT * FROM user WHERE username = ?', (username,)
-    #     ).fetchone()
-
-    #     if user is None:
-    #         error = 'Nombre incorrecto.'
-    #     elif not check_password_hash(user['password'], password):
-    #         error = 'Contrasenya incorrecta.'
-
-    #     if error is None:
-    #         session.clear()
-    #         session['user_id'] = user['id']
-    #         return redirect(url_for('index'))
-
-    #     flash(error)
-
-    return render_template('auth/login.html')
+        # el campo email del formulario acepta también el nombre de usuario
+        error = None
+        user = get_read_db().execute(
+            'SELECT * FROM user WHERE email = ? OR username = ?',
+            (form.email.data, form.email.data)
+        ).fetchone()
+
+        if user is None:
+            error = 'Nombre incorrecto.'
+        elif not check_password(user['password'], form.password.data):
+            error = 'Contrasenya incorrecta.'
+
+        if error is None:
+            # si el hash se hizo con otro método o coste, se rehace ahora que
+            # tenemos la contraseña en claro
+            if get_hasher().needs_rehash(user['password']):
+                db = get_write_db()
+                db.execute(
+                    'UPDATE user SET password = ? WHERE id = ?',
+                    (hash_password(form.password.data), user['id'])
+                )
+                db.commit()
+                invalidate_user(user['id'])
+            session.clear()
+            session['user_id'] = user['id']
+            return redirect(url_for('index'))
+
+        flash(error)
+
+    return render_template('auth/login.html', form=form)
 
 
 '''
 bp.before_app_request registra una función que se ejectua antes de la
 función de la vista (view) indiferentemente de la url solicitada. Comprueba
 si un usuario está almacenado en la sessión y obtiene los datos de ese 
-usuario y lo guarda en g
+usuario y lo guarda en g.
+Las filas de usuario se guardan en una caché LRU con caducidad para no
+hacer un SELECT en cada petición; los ficheros estáticos ni se miran.
 '''
 @bp.before_app_request
 def load_logged_in_user():
     user_id = session.get('user_id')
 
-    if user_id is None:
+    if user_id is None or request.endpoint == 'static':
         g.user = None
-    else:
-        g.user = get_db().execute(
+        return
+
+    cache = get_cache('users')
+    g.user = cache.get(user_id)
+    if g.user is None:
+        g.user = get_read_db().execute(
             'SELECT * FROM user WHERE id = ?', (user_id,)
         ).fetchone()
+        if g.user is not None:
+            cache.set(user_id, g.user)
+
+def invalidate_user(user_id):
+    '''Hay que llamarla siempre que cambie la fila del usuario en la bd.'''
+    get_cache('users').delete(user_id)
+    current_app.extensions['flaskr.users'].invalidate(user_id)
 
 @bp.route('/logout')
 def logout():
@@ -108,4 +136,16 @@ def login_required(view):
 
         return view(**kwargs)
     
-    return wrapped_view
\ No newline at end of file
+    return wrapped_view
+
+def init_app(app):
+    '''
+    USER_CACHE_SIZE es el número de usuarios en caché (0 la desactiva) y
+    USER_CACHE_TTL los segundos que vale cada entrada.
+    '''
+    app.config.setdefault('USER_CACHE_SIZE', 1024)
+    app.config.setdefault('USER_CACHE_TTL', 60)
+    register_cache(app, 'users', LRUCache(
+        app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL']
+    ))
+    app.register_blueprint(bp)
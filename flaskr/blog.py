@@ -1,64 +1,498 @@
+import hashlib
+import os
+import re
+import sqlite3
+import unicodedata
+from datetime import datetime, timezone
+
+import click
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, url_for
+    Blueprint, current_app, flash, g, has_app_context, make_response,
+    redirect, render_template, request, session, url_for
 )
+from flask.cli import with_appcontext
+from markupsafe import Markup, escape
 from werkzeug.exceptions import abort
+from werkzeug.http import is_resource_modified
 
-from flaskr.auth import login_required
-from flaskr.db import get_db
+from flaskr.auth import invalidate_user, login_required
+from flaskr.cache import LRUCache, get_cache, make_fragment_cache, register_cache
+from flaskr.db import MAX_INTEGER, get_db, get_read_db
 from flaskr.forms import PostForm
+from flaskr.rendering import RENDERER_VERSION, rendered_columns
+from flaskr.writer import write
 
 bp = Blueprint('blog', __name__)
 
+# SELECT comú per a les llistes de posts. Les pàgines es recorren amb un
+# cursor (created, id) en lloc d'OFFSET, de manera que cada pàgina és un
+# rang sobre l'índex post_created_id_idx i costa el mateix sigui quina sigui.
+POST_LIST_SQL = (
+    'SELECT p.id, title, slug, body, body_html, excerpt, render_version,'
+    ' created, author_id, username FROM post p JOIN user u ON p.author_id = u.id'
+)
+
+def encode_cursor(post):
+    return f"{post['created']},{post['id']}"
+
+def decode_cursor(value):
+    '''
+    Convierte un cursor "<created>,<id>" de la query string en una tupla
+    (created, id) comparable con las columnas de post. Un cursor mal formado,
+    o con una id que no cabe en un INTEGER de sqlite, es un error del
+    cliente (400).
+    '''
+    created, sep, id = value.rpartition(',')
+    try:
+        id = int(id)
+        if not 0 < id <= MAX_INTEGER:
+            raise ValueError(f'id fuera de rango: {id}')
+        return str(datetime.fromisoformat(created)), id
+    except ValueError:
+        abort(400, f"cursor {value!r} no válido.")
+
+def keyset_page(select_sql, alias, where=None, params=(), before=None,
+                after=None, per_page=None):
+    '''
+    Devuelve (filas, prev_cursor, next_cursor) de una página de select_sql
+    ordenada de más nuevo a más antiguo por (alias.created, alias.id).
+    - where/params añaden una condición extra (autor, rango de fechas...)
+    - before devuelve las filas anteriores (más viejas) al cursor y after las
+    posteriores, leídas en orden ascendente y giradas después.
+    Se pide una fila de más para saber si hay otra página sin hacer COUNT(*).
+    '''
+    if per_page is None:
+        per_page = current_app.config['POSTS_PER_PAGE']
+
+    conditions = [where] if where else []
+    params = list(params)
+    order = 'DESC'
+    if before is not None:
+        conditions.append(f'({alias}.created, {alias}.id) < (?, ?)')
+        params.extend(before)
+    elif after is not None:
+        conditions.append(f'({alias}.created, {alias}.id) > (?, ?)')
+        params.extend(after)
+        order = 'ASC'
+
+    sql = select_sql
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += f' ORDER BY {alias}.created {order}, {alias}.id {order} LIMIT ?'
+    params.append(per_page + 1)
+
+    rows = get_read_db().execute(sql, params).fetchall()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if after is not None:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = before is not None, has_more
+
+    if not rows:
+        return rows, None, None
+
+    prev_cursor = encode_cursor(rows[0]) if has_prev else None
+    next_cursor = encode_cursor(rows[-1]) if has_next else None
+    return rows, prev_cursor, next_cursor
+
+def get_posts_page(where=None, params=(), before=None, after=None, per_page=None):
+    '''Una página de posts (ver keyset_page).'''
+    return keyset_page(POST_LIST_SQL, 'p', where, params, before, after, per_page)
+
+def cursor_args():
+    '''Lee los parámetros ?before= / ?after= de la petición actual.'''
+    before = request.args.get('before')
+    after = request.args.get('after')
+    return (
+        decode_cursor(before) if before else None,
+        decode_cursor(after) if after and not before else None,
+    )
+
+def get_content_version():
+    '''
+    Versión del contenido del blog (fila 'post' de content_version): sube en
+    cada escritura y forma parte de las claves de la caché de fragmentos.
+    '''
+    if 'content_version' not in g:
+        g.content_version = get_read_db().execute(
+            "SELECT version, modified FROM content_version WHERE name = 'post'"
+        ).fetchone()
+    return g.content_version
+
+def bump_content_version(db):
+    '''Se llama dentro de la misma transacción que la escritura.'''
+    db.execute(
+        'UPDATE content_version SET version = version + 1,'
+        " modified = CURRENT_TIMESTAMP WHERE name = 'post'"
+    )
+    # desde el hilo de la cola de escritura no hay contexto de la app
+    if has_app_context():
+        g.pop('content_version', None)
+
+def get_fragment_cache():
+    return current_app.extensions['flaskr.fragments']
+
+def render_cached(key, render):
+    '''Devuelve el fragmento de la caché o lo renderiza y lo guarda.'''
+    fragments = get_fragment_cache()
+    if fragments is None:
+        return Markup(render())
+    version = get_content_version()['version']
+    return Markup(fragments.get_or_render(f'{version}:{key}', render))
+
+def render_post(post):
+    can_edit = g.user is not None and g.user['id'] == post['author_id']
+    return render_cached(
+        f"post:{post['id']}:{int(can_edit)}",
+        lambda: render_template('blog/_post.html', post=post, can_edit=can_edit)
+    )
+
+def conditional_response(parts, render):
+    '''
+    Respuesta con ETag y Last-Modified sacados de la versión del contenido.
+    Si el navegador ya tiene esa versión (If-None-Match / If-Modified-Since)
+    se contesta 304 sin llamar a render, así que la visita repetida cuesta
+    la consulta de la versión y nada más.
+    - parts es lo que, además de la versión, cambia la página (usuario,
+    cursor...). El usuario va siempre porque la cabecera de la página es
+    distinta para cada uno.
+    - con mensajes flash pendientes no se contesta 304 para no perderlos.
+    '''
+    version = get_content_version()
+    user_id = g.user['id'] if g.user else 0
+    key = ':'.join(str(part) for part in (version['version'], user_id, *parts))
+    etag = hashlib.sha1(key.encode()).hexdigest()[:20]
+    last_modified = version['modified'].replace(tzinfo=timezone.utc)
+
+    if '_flashes' not in session and not is_resource_modified(
+        request.environ, etag=etag, last_modified=last_modified
+    ):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+
+    response.set_etag(etag, weak=True)
+    response.last_modified = last_modified
+    response.vary.add('Cookie')
+    response.cache_control.no_cache = True
+    if g.user is not None:
+        response.cache_control.private = True
+    return response
+
 @bp.route('/')
 def index():
-    db = get_db()
-    posts = db.execute(
-        'SELECT p.id, title, body, created, author_id, username'
-        ' FROM post p JOIN user u ON p.author_id = u.id'
-        ' ORDER BY created DESC'
+    before, after = cursor_args()
+    per_page = current_app.config['POSTS_PER_PAGE']
+    user_id = g.user['id'] if g.user else 0
+
+    def render_list():
+        posts, prev_cursor, next_cursor = get_posts_page(
+            before=before, after=after, per_page=per_page
+        )
+        return render_template(
+            'blog/_post_list.html', articles=[render_post(p) for p in posts],
+            prev_cursor=prev_cursor, next_cursor=next_cursor
+        )
+
+    def render_page():
+        post_list = render_cached(
+            f'index:{user_id}:{per_page}:{before}:{after}', render_list
+        )
+        return render_template(
+            'blog/index.html', post_list=post_list,
+            archive_nav=render_archive_nav()
+        )
+
+    return conditional_response(('index', per_page, before, after), render_page)
+
+SLUG_MAX_LENGTH = 80
+
+def slugify(text):
+    '''
+    "¿Qué tal, Mónica?" -> "que-tal-monica". Los caracteres que no tienen
+    equivalente ASCII se quitan; si no queda nada devuelve '' y el slug se
+    saca de la id del post (ver fallback_slug).
+    '''
+    text = unicodedata.normalize('NFKD', text)
+    text = text.encode('ascii', 'ignore').decode('ascii').lower()
+    slug = re.sub(r'[^a-z0-9]+', '-', text).strip('-')
+    return slug[:SLUG_MAX_LENGTH].rstrip('-')
+
+def fallback_slug(id):
+    '''
+    Slug de los títulos sin letras ASCII ("日本" -> "post-12"). Con la id no
+    se acumulan "post", "post-2"... que unique_slug tendría que recorrer
+    enteros en cada post nuevo.
+    '''
+    return f'post-{id}'
+
+def unique_slug(db, base):
+    '''
+    Devuelve base o, si ya está cogido, base-2, base-3... (el primero libre).
+    Los candidatos se leen con un solo rango sobre post_slug_idx: los slugs
+    que empiezan por "base-" están entre "base-" y "base." ('.' va justo
+    después de '-').
+    '''
+    taken = {
+        row[0] for row in db.execute(
+            'SELECT slug FROM post WHERE slug = ? OR (slug > ? AND slug < ?)',
+            (base, base + '-', base + '.')
+        )
+    }
+    slug, n = base, 1
+    while slug in taken:
+        n += 1
+        slug = f'{base}-{n}'
+    return slug
+
+def insert_post(db, title, body, author_id, slug=None):
+    '''
+    Inserta el post con su slug único (sacado de slug o del título) y el
+    HTML ya generado. Si otra petición coge el mismo slug entre la consulta
+    y el INSERT, el índice único lo rechaza y se prueba con el siguiente.
+    Devuelve (id, slug). No hace commit.
+    '''
+    base = slugify(slug or title)
+    if not base:
+        cursor = db.execute(
+            'INSERT INTO post (title, body, body_html, excerpt, render_version,'
+            ' author_id) VALUES (?, ?, ?, ?, ?, ?)',
+            (title, body, *rendered_columns(body), author_id)
+        )
+        slug = unique_slug(db, fallback_slug(cursor.lastrowid))
+        db.execute('UPDATE post SET slug = ? WHERE id = ?', (slug, cursor.lastrowid))
+        return cursor.lastrowid, slug
+    for attempt in range(3):
+        slug = unique_slug(db, base)
+        try:
+            cursor = db.execute(
+                'INSERT INTO post (title, slug, body, body_html, excerpt,'
+                ' render_version, author_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (title, slug, body, *rendered_columns(body), author_id)
+            )
+        except sqlite3.IntegrityError:
+            if attempt == 2:
+                raise
+        else:
+            return cursor.lastrowid, slug
+
+def fill_slugs(db, limit=-1):
+    '''
+    Da slug a (como mucho `limit`) posts que no lo tienen, como los de
+    import-posts o los de antes de la columna slug. Los busca por
+    post_slug_idx, que también indexa los NULL. Devuelve cuántos. No hace
+    commit.
+    '''
+    rows = db.execute(
+        'SELECT id, title FROM post WHERE slug IS NULL ORDER BY id LIMIT ?',
+        (limit,)
     ).fetchall()
-    return render_template('blog/index.html', posts=posts)
+    for row in rows:
+        slug = unique_slug(db, slugify(row['title']) or fallback_slug(row['id']))
+        db.execute('UPDATE post SET slug = ? WHERE id = ?', (slug, row['id']))
+    return len(rows)
+
+# escrituras de posts: funciones fn(db, ...) sin commit para writer.write()
+def create_post(db, title, body, author_id, slug=None):
+    id, slug = insert_post(db, title, body, author_id, slug)
+    bump_content_version(db)
+    return id, slug
+
+def update_post(db, id, title, body):
+    db.execute(
+        'UPDATE post SET title = ?, body = ?, body_html = ?,'
+        ' excerpt = ?, render_version = ? WHERE id = ?',
+        (title, body, *rendered_columns(body), id)
+    )
+    bump_content_version(db)
+
+def delete_post(db, id):
+    db.execute('DELETE FROM post WHERE id = ?', (id,))
+    bump_content_version(db)
 
 @bp.route('/create', methods=('GET', 'POST'))
 @login_required
 def create():
     form = PostForm()
-    # if request.method == 'POST':
-    #     title = request.form['title']
-    #     body = request.form['body']
-    #     error = None
-
-    #     if not title:
-    #         error = 'Title is required.'
-        
-    #     if error is not None:
-    #         flash(error)
-    #     else:
-    #         db = get_db()
-    #         db.execute(
-    #             'INSERT INTO post (title, body, author_id)'
-    #             ' VALUES (?, ?, ?)',
-    #             (title, body, g.user['id'])
-    #         )
-    #         db.commit()
-    #         return redirect(url_for('blog.index'))
-    
-    # return render_template('blog/create.html')
     if form.validate_on_submit():
-        title = form.title.data
-        title_slug = form.title_slug.data
-        content = form.content.data
+        write(
+            create_post, form.title.data, form.content.data or '',
+            g.user['id'], form.title_slug.data
+        )
+        # el trigger ha cambiado post_count en la fila del usuario
+        invalidate_user(g.user['id'])
+        return redirect(url_for('blog.index'))
+
+    return render_template('blog/create.html', form=form)
+
+@bp.route('/p/<slug>')
+def permalink(slug):
+    '''
+    Página pública de un post. La caché 'slugs' guarda slug -> id de los
+    posts más visitados; si no está, la fila se busca por post_slug_idx.
+    '''
+    slugs = get_cache('slugs')
+    id = slugs.get(slug)
+    db = get_read_db()
+    if id is not None:
+        post = db.execute(POST_LIST_SQL + ' WHERE p.id = ?', (id,)).fetchone()
+    else:
+        post = db.execute(POST_LIST_SQL + ' WHERE p.slug = ?', (slug,)).fetchone()
+    if post is None or post['slug'] != slug:
+        slugs.delete(slug)
+        abort(404, f"el post {slug} no existe.")
+    slugs.set(slug, post['id'])
+
+    return conditional_response(
+        ('post', post['id']),
+        lambda: render_template(
+            'blog/post.html', post=post, article=render_post(post),
+            archive_nav=render_archive_nav()
+        )
+    )
+
+@bp.route('/u/<username>')
+def author(username):
+    '''
+    Posts de un autor, paginados por cursor sobre post_author_created_idx.
+    El número de posts sale de user.post_count, sin contar filas.
+    '''
+    user = get_read_db().execute(
+        'SELECT id, username, post_count FROM user WHERE username = ?',
+        (username,)
+    ).fetchone()
+    if user is None:
+        abort(404, f"el usuario {username} no existe.")
+    before, after = cursor_args()
+
+    def render_page():
+        posts, prev_cursor, next_cursor = get_posts_page(
+            'p.author_id = ?', (user['id'],), before=before, after=after
+        )
+        return render_template(
+            'blog/author.html', author=user, posts=posts,
+            archive_nav=render_archive_nav(),
+            prev_cursor=prev_cursor, next_cursor=next_cursor
+        )
+
+    return conditional_response(('author', user['id'], before, after), render_page)
+
+def archive_months():
+    '''[(mes "YYYY-MM", posts)] de más nuevo a más antiguo, de post_archive.'''
+    return get_read_db().execute(
+        'SELECT month, SUM(count) AS count FROM post_archive'
+        ' GROUP BY month ORDER BY month DESC'
+    ).fetchall()
+
+def render_archive_nav():
+    return render_cached(
+        'archive-nav',
+        lambda: render_template('blog/_archive_nav.html', months=archive_months())
+    )
+
+@bp.route('/archive/<int(fixed_digits=4):year>/<int(fixed_digits=2):month>')
+def archive(year, month):
+    '''
+    Posts de un mes, paginados por cursor. El mes es un rango sobre
+    created, así que se recorre post_created_id_idx.
+    '''
+    if not (1 <= month <= 12 and 1 <= year <= 9999):
+        abort(404)
+    start = f'{year:04d}-{month:02d}-01 00:00:00'
+    if month == 12:
+        end = f'{year + 1:04d}-01-01 00:00:00'
+    else:
+        end = f'{year:04d}-{month + 1:02d}-01 00:00:00'
+    before, after = cursor_args()
+
+    def render_page():
+        posts, prev_cursor, next_cursor = get_posts_page(
+            'p.created >= ? AND p.created < ?', (start, end),
+            before=before, after=after
+        )
+        return render_template(
+            'blog/archive.html', year=year, month=month, posts=posts,
+            archive_nav=render_archive_nav(),
+            prev_cursor=prev_cursor, next_cursor=next_cursor
+        )
+
+    return conditional_response(
+        ('archive', year, month, before, after), render_page
+    )
 
-        post = {'title': title, 'title_slug': title_slug, 'content': content}
-        # Aquesta llista de posts és una xapu temporal fins que implementi bé la bd
-        posts = []
-        posts.append(post)
+# marcas que pone fts5 alrededor de las coincidencias; son caracteres de
+# control para poder escapar el texto y cambiarlas después por <mark>
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+def fts_query(text):
+    '''
+    Convierte lo que escribe el usuario en una consulta fts5 segura: cada
+    palabra entre comillas (AND implícito) y la última como prefijo, para
+    que los operadores de fts5 no den errores de sintaxis.
+    '''
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+def highlight(text):
+    return Markup(
+        str(escape(text))
+        .replace(_MARK_START, '<mark>')
+        .replace(_MARK_END, '</mark>')
+    )
+
+def search_posts(text, page=1, per_page=None):
+    '''
+    Busca en post_fts ordenando por bm25 (el título pesa más que el cuerpo).
+    Devuelve (resultados, hay_más). Se pagina con OFFSET: los resultados
+    están ordenados por relevancia, no por un índice.
+    '''
+    if per_page is None:
+        per_page = current_app.config['POSTS_PER_PAGE']
+    query = fts_query(text)
+    if query is None:
+        return [], False
+
+    rows = get_read_db().execute(
+        'SELECT p.id, p.created, p.author_id, u.username,'
+        ' highlight(post_fts, 0, ?, ?) AS title,'
+        " snippet(post_fts, 1, ?, ?, '…', 24) AS snippet"
+        ' FROM post_fts'
+        ' JOIN post p ON p.id = post_fts.rowid'
+        ' JOIN user u ON p.author_id = u.id'
+        ' WHERE post_fts MATCH ?'
+        ' ORDER BY bm25(post_fts, 10.0, 1.0)'
+        ' LIMIT ? OFFSET ?',
+        (_MARK_START, _MARK_END, _MARK_START, _MARK_END,
+         query, per_page + 1, (page - 1) * per_page)
+    ).fetchall()
+
+    results = [
+        dict(row, title=highlight(row['title']), snippet=highlight(row['snippet']))
+        for row in rows[:per_page]
+    ]
+    return results, len(rows) > per_page
+
+@bp.route('/search')
+def search():
+    q = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
+    # el OFFSET de la página tiene que caber en un INTEGER de sqlite
+    if page < 1 or (page - 1) * current_app.config['POSTS_PER_PAGE'] > MAX_INTEGER:
+        abort(400, 'página no válida.')
+
+    results, has_next = search_posts(q, page)
+    return render_template(
+        'blog/search.html', q=q, page=page, results=results, has_next=has_next
+    )
 
 def get_post(id, check_author=True):
-    post = get_db().execute(
-        'SELECT p.id, title, body, created, author_id, username'
-        ' FROM post p JOIN user u ON p.author_id = u.id'
-        ' WHERE p.id = ?',
+    post = get_read_db().execute(
+        POST_LIST_SQL + ' WHERE p.id = ?',
         (id,)
     ).fetchone()
 
@@ -86,22 +520,125 @@ def update(id):
         if error is not None:
             flash(error)
         else:
-            db = get_db()
-            db.execute(
-                'UPDATE post SET title = ?, body = ?'
-                ' WHERE id = ?',
-                (title, body, id)
-            )
-            db.commit()
+            write(update_post, id, title, body)
             return redirect(url_for('blog.index'))
 
-    return render_template('blog/update.html', post=post)
+        return render_template('blog/update.html', post=post)
+
+    return conditional_response(
+        ('update', id), lambda: render_template('blog/update.html', post=post)
+    )
 
 @bp.route('/<int:id>/delete', methods=('POST',))
 @login_required
 def delete(id):
-    get_post(id)
+    post = get_post(id)
+    write(delete_post, id)
+    if post['slug'] is not None:
+        get_cache('slugs').delete(post['slug'])
+    invalidate_user(post['author_id'])
+    return redirect(url_for('blog.index'))
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    '''Reconstruye el índice de texto completo a partir de la tabla post.'''
     db = get_db()
-    db.execute('DELETE FROM post WHERE id = ?', (id,))
+    db.execute("INSERT INTO post_fts (post_fts) VALUES ('rebuild')")
+    db.execute("INSERT INTO post_fts (post_fts) VALUES ('optimize')")
     db.commit()
-    return redirect(url_for('blog.index'))
\ No newline at end of file
+    click.echo('Reconstruido el índice de búsqueda')
+
+@click.command('render-posts')
+@click.option(
+    '--batch-size', type=click.IntRange(min=1), default=500, show_default=True,
+    help='Posts por transacción.'
+)
+@click.option('--all', 'all_posts', is_flag=True,
+              help='Regenera también los que ya tienen la versión actual.')
+@with_appcontext
+def render_posts_command(batch_size, all_posts):
+    '''
+    Genera body_html y excerpt de los posts hechos con una versión anterior
+    del conversor (o de todos con --all). Va por bloques de ids con un
+    commit por bloque, así que se puede interrumpir y volver a lanzar.
+    '''
+    db = get_db()
+    version = RENDERER_VERSION + 1 if all_posts else RENDERER_VERSION
+    last_id, total = 0, 0
+    while True:
+        rows = db.execute(
+            'SELECT id, body FROM post WHERE id > ? AND render_version < ?'
+            ' ORDER BY id LIMIT ?',
+            (last_id, version, batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        db.executemany(
+            'UPDATE post SET body_html = ?, excerpt = ?, render_version = ?'
+            ' WHERE id = ?',
+            [(*rendered_columns(row['body']), row['id']) for row in rows]
+        )
+        db.commit()
+        last_id = rows[-1]['id']
+        total += len(rows)
+
+    if total:
+        bump_content_version(db)
+        db.commit()
+    click.echo(f'Regenerados {total} posts')
+
+@click.command('fill-slugs')
+@click.option(
+    '--batch-size', type=click.IntRange(min=1), default=500, show_default=True,
+    help='Posts por transacción.'
+)
+@with_appcontext
+def fill_slugs_command(batch_size):
+    '''Da slug (y con él /p/<slug>) a los posts que no lo tienen.'''
+    db = get_db()
+    total = 0
+    while True:
+        count = fill_slugs(db, batch_size)
+        if not count:
+            break
+        # las listas enlazan el título al permalink
+        bump_content_version(db)
+        db.commit()
+        total += count
+    click.echo(f'Añadido el slug a {total} posts')
+
+@click.command('rebuild-archive')
+@with_appcontext
+def rebuild_archive_command():
+    '''Rehace post_archive contando los posts de la tabla post.'''
+    db = get_db()
+    db.execute('DELETE FROM post_archive')
+    db.execute(
+        'INSERT INTO post_archive (month, author_id, count)'
+        " SELECT strftime('%Y-%m', created), author_id, COUNT(*)"
+        ' FROM post GROUP BY 1, 2'
+    )
+    bump_content_version(db)
+    db.commit()
+    count = db.execute('SELECT COUNT(*) FROM post_archive').fetchone()[0]
+    click.echo(f'Reconstruido el archivo ({count} filas)')
+
+def init_app(app):
+    app.config.setdefault('FRAGMENT_CACHE', 'memory')
+    app.config.setdefault('FRAGMENT_CACHE_MAX_SIZE', 4 * 1024 * 1024)
+    app.config.setdefault(
+        'FRAGMENT_CACHE_PATH', os.path.join(app.instance_path, 'fragments.sqlite')
+    )
+    app.config.setdefault('FRAGMENT_CACHE_MAX_ENTRIES', 10000)
+    app.config.setdefault('SLUG_CACHE_SIZE', 4096)
+    register_cache(app, 'slugs', LRUCache(app.config['SLUG_CACHE_SIZE']))
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(render_posts_command)
+    app.cli.add_command(fill_slugs_command)
+    app.cli.add_command(rebuild_archive_command)
+    fragments = make_fragment_cache(app.config)
+    app.extensions['flaskr.fragments'] = fragments
+    if fragments is not None:
+        register_cache(app, 'fragments', fragments)
+    app.register_blueprint(bp)
\ No newline at end of file
@@ -0,0 +1,228 @@
+'''
+Órdenes para exportar e importar posts y enlaces en masa:
+
+    flask export-posts posts.ndjson
+    flask import-posts posts.csv --batch-size 5000
+
+El formato (NDJSON, un objeto JSON por línea, o CSV con cabecera) se deduce
+de la extensión o se indica con --format. Todo va en streaming: la
+exportación recorre el cursor por bloques y la importación lee el fichero
+con generadores e inserta con executemany en transacciones de --batch-size
+filas, así que la memoria no depende del tamaño del fichero.
+'''
+import csv
+import json
+import time
+from itertools import islice
+
+import click
+from flask.cli import with_appcontext
+
+from flaskr.blog import bump_content_version, fill_slugs
+from flaskr.db import get_db, get_read_db, iter_rows
+from flaskr.enlaces import enlace_params
+from flaskr.rendering import rendered_columns
+
+POST_FIELDS = ('id', 'title', 'body', 'author_id', 'created')
+ENLACE_FIELDS = (
+    'id', 'url_enlace', 'url_canonica', 'author_id', 'created', 'compartido',
+    'clicks',
+)
+
+# como UPSERT_ENLACE_SQL, pero con compartido y clicks del fichero: si el
+# enlace ya existe se suman a los que tiene
+IMPORT_ENLACE_SQL = (
+    'INSERT INTO enlaces (author_id, url_enlace, url_canonica, url_hash, created,'
+    ' compartido, clicks)'
+    ' VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?)'
+    ' ON CONFLICT (url_hash) DO UPDATE SET'
+    ' compartido = compartido + excluded.compartido,'
+    ' clicks = clicks + excluded.clicks'
+    ' WHERE url_canonica = excluded.url_canonica'
+)
+
+# cada cuántas filas exportadas se informa del progreso
+REPORT_EVERY = 10000
+
+def _guess_format(file, format):
+    if format is not None:
+        return format
+    return 'csv' if getattr(file, 'name', '').endswith('.csv') else 'ndjson'
+
+def write_rows(file, format, fields, rows, progress):
+    if format == 'csv':
+        writer = csv.writer(file)
+        writer.writerow(fields)
+        write = writer.writerow
+    else:
+        def write(row):
+            file.write(json.dumps(dict(zip(fields, row)), default=str))
+            file.write('\n')
+
+    for batch in batches(rows, REPORT_EVERY):
+        for row in batch:
+            write(row)
+        progress.update(len(batch))
+
+def read_records(file, format):
+    '''Genera (número de línea, diccionario) de un fichero NDJSON o CSV.'''
+    if format == 'csv':
+        # la línea 1 es la cabecera
+        for number, record in enumerate(csv.DictReader(file), start=2):
+            yield number, record
+    else:
+        for number, line in enumerate(file, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    raise click.ClickException(f'línea {number}: {e}')
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            break
+        yield batch
+
+class Progress(object):
+    '''Informa por stderr de las filas procesadas y de las filas por segundo.'''
+
+    def __init__(self, verb):
+        self.verb = verb
+        self.count = 0
+        self.start = time.perf_counter()
+
+    def update(self, count):
+        self.count += count
+        self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        rate = self.count / elapsed if elapsed > 0 else 0
+        click.echo(f'{self.verb} {self.count} filas ({rate:.0f} filas/s)', err=True)
+
+def import_batches(db, sql, params, batch_size, progress, before_commit=None):
+    '''before_commit(db) se ejecuta en la transacción de cada lote.'''
+    for batch in batches(params, batch_size):
+        db.executemany(sql, batch)
+        if before_commit is not None:
+            before_commit(db)
+        db.commit()
+        progress.update(len(batch))
+
+def _required(number, record, name):
+    value = record.get(name)
+    if value in (None, ''):
+        raise click.ClickException(f'línea {number}: falta {name}')
+    return value
+
+def _integer(number, record, name, default=None):
+    value = record.get(name)
+    if value in (None, '') and default is not None:
+        return default
+    try:
+        return int(_required(number, record, name))
+    except ValueError:
+        raise click.ClickException(f'línea {number}: {name} no es un número')
+
+def post_params(records):
+    for number, record in records:
+        body = record.get('body') or ''
+        yield (
+            _required(number, record, 'title'),
+            body,
+            *rendered_columns(body),
+            _integer(number, record, 'author_id'),
+            record.get('created') or None,
+        )
+
+def enlace_records_params(records):
+    for number, record in records:
+        url = record.get('url_enlace') or _required(number, record, 'url')
+        author_id = _integer(number, record, 'author_id')
+        try:
+            params = enlace_params(url, author_id, record.get('created') or None)
+        except ValueError as e:
+            raise click.ClickException(f'línea {number}: {e}')
+        yield (
+            *params,
+            _integer(number, record, 'compartido', 1),
+            _integer(number, record, 'clicks', 0),
+        )
+
+format_option = click.option(
+    '--format', type=click.Choice(['ndjson', 'csv']), default=None,
+    help='Por defecto según la extensión del fichero (.csv o NDJSON).'
+)
+batch_option = click.option(
+    '--batch-size', type=click.IntRange(min=1), default=5000, show_default=True,
+    help='Filas por transacción.'
+)
+
+@click.command('export-posts')
+@click.argument('file', type=click.File('w', encoding='utf8'))
+@format_option
+@with_appcontext
+def export_posts_command(file, format):
+    cursor = get_read_db().execute(
+        f"SELECT {', '.join(POST_FIELDS)} FROM post ORDER BY id"
+    )
+    write_rows(
+        file, _guess_format(file, format), POST_FIELDS, iter_rows(cursor),
+        Progress('Exportadas')
+    )
+
+def finish_posts_batch(db):
+    '''
+    Se ejecuta en la transacción de cada lote de import-posts: les da slug
+    a los posts que se acaban de insertar y, como el lote ya se verá al
+    confirmarlo, sube la versión del contenido.
+    '''
+    fill_slugs(db)
+    bump_content_version(db)
+
+@click.command('import-posts')
+@click.argument('file', type=click.File('r', encoding='utf8'))
+@format_option
+@batch_option
+@with_appcontext
+def import_posts_command(file, format, batch_size):
+    db = get_db()
+    progress = Progress('Importadas')
+    import_batches(
+        db,
+        'INSERT INTO post (title, body, body_html, excerpt, render_version,'
+        ' author_id, created)'
+        ' VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))',
+        post_params(read_records(file, _guess_format(file, format))),
+        batch_size, progress, before_commit=finish_posts_batch
+    )
+
+@click.command('export-links')
+@click.argument('file', type=click.File('w', encoding='utf8'))
+@format_option
+@with_appcontext
+def export_links_command(file, format):
+    cursor = get_read_db().execute(
+        f"SELECT {', '.join(ENLACE_FIELDS)} FROM enlaces ORDER BY id"
+    )
+    write_rows(
+        file, _guess_format(file, format), ENLACE_FIELDS, iter_rows(cursor),
+        Progress('Exportados')
+    )
+
+@click.command('import-links')
+@click.argument('file', type=click.File('r', encoding='utf8'))
+@format_option
+@batch_option
+@with_appcontext
+def import_links_command(file, format, batch_size):
+    '''Los enlaces repetidos se fusionan con los que ya hay (ver enlaces.py).'''
+    progress = Progress('Importados')
+    import_batches(
+        get_db(), IMPORT_ENLACE_SQL,
+        enlace_records_params(read_records(file, _guess_format(file, format))),
+        batch_size, progress
+    )
@@ -0,0 +1,213 @@
+'''
+Cachés en memoria del proceso.
+LRUCache es un diccionario ordenado con tamaño máximo y, opcionalmente,
+caducidad (ttl en segundos). Las cachés que se registran con
+register_cache() aparecen con sus aciertos y fallos en /metrics.
+FragmentCache guarda HTML renderizado en memoria o en un fichero sqlite.
+'''
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+_MISSING = object()
+
+class LRUCache(object):
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # clave -> (valor, momento en que caduca o None)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING:
+                value, expires = item
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            'hits': self.hits, 'misses': self.misses,
+            'evictions': self.evictions, 'size': len(self._data),
+        }
+
+def register_cache(app, name, cache):
+    app.extensions.setdefault('flaskr.caches', {})[name] = cache
+    return cache
+
+def get_cache(name, app=None):
+    if app is None:
+        app = current_app
+    return app.extensions['flaskr.caches'][name]
+
+class MemoryFragmentBackend(object):
+    '''LRU de fragmentos HTML limitado por el total de caracteres guardados.'''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_size:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                key, old = self._data.popitem(last=False)
+                self.size -= len(old)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._data)
+
+class SqliteFragmentBackend(object):
+    '''
+    Fragmentos guardados en un fichero sqlite aparte, compartido por todos
+    los procesos de la máquina. Cada hilo usa su propia conexión y, cuando
+    hay más de max_entries, se borran las entradas más antiguas.
+    '''
+
+    def __init__(self, path, max_entries):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS fragment ('
+                ' key TEXT PRIMARY KEY, value TEXT NOT NULL)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM fragment WHERE key = ?', (key,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def set(self, key, value):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO fragment (key, value) VALUES (?, ?)',
+                (key, value)
+            )
+            self._writes += 1
+            # la limpieza se hace de vez en cuando, no en cada escritura
+            if self._writes % 100 == 0:
+                conn.execute(
+                    'DELETE FROM fragment WHERE rowid <='
+                    ' (SELECT MAX(rowid) FROM fragment) - ?',
+                    (self.max_entries,)
+                )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM fragment')
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM fragment').fetchone()[0]
+
+class FragmentCache(object):
+    '''
+    Caché de HTML ya renderizado. Las claves llevan la versión del contenido,
+    así que al escribir basta con subir la versión: las entradas viejas no se
+    vuelven a pedir y acaban saliendo por el límite de tamaño.
+    '''
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = render()
+        self.backend.set(key, value)
+        return value
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.backend)}
+
+def make_fragment_cache(config):
+    '''
+    FRAGMENT_CACHE elige el backend: 'memory' (LRU de FRAGMENT_CACHE_MAX_SIZE
+    caracteres por proceso), 'sqlite' (fichero FRAGMENT_CACHE_PATH con como
+    mucho FRAGMENT_CACHE_MAX_ENTRIES entradas) o None para no cachear.
+    '''
+    backend = config['FRAGMENT_CACHE']
+    if backend == 'memory':
+        return FragmentCache(MemoryFragmentBackend(config['FRAGMENT_CACHE_MAX_SIZE']))
+    if backend == 'sqlite':
+        return FragmentCache(SqliteFragmentBackend(
+            config['FRAGMENT_CACHE_PATH'], config['FRAGMENT_CACHE_MAX_ENTRIES']
+        ))
+    if backend is None:
+        return None
+    raise ValueError(f'FRAGMENT_CACHE {backend!r} no válido')
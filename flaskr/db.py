@@ -1,8 +1,14 @@
+import os
 import sqlite3
+import threading
+import time
 from datetime import datetime
+from pathlib import Path
 
 import click
 from flask import current_app, g
+
+from flaskr.metrics import InstrumentedConnection
 '''
 - g es un objeto especial para almacenar datos a los que accederán diferentes
 funciones durante las peticiones y que serán reutilizadosen lugar crear nuevas
@@ -12,21 +18,250 @@ peticiones, puesto que al utilizar la "fábrica de apps" (el archivo __init__),
 no hay objeto "app" mientras escribimos este código
 '''
 
-def get_db():
-    if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
+# el mayor valor que cabe en un INTEGER de sqlite (entero con signo de 64
+# bits); pasarle uno mayor como parámetro lanza OverflowError
+MAX_INTEGER = 2 ** 63 - 1
+
+class ConnectionPool(object):
+    '''
+    Pool acotado de conexiones sqlite, una por hilo.
+    Cada hilo reutiliza su propia conexión entre peticiones (así se conservan
+    la caché de páginas y la de sentencias preparadas), y el número total de
+    conexiones abiertas no pasa de `size`. Si se llega al límite, se abre una
+    conexión de desbordamiento que se cierra al devolverla.
+    '''
+
+    def __init__(self, config, read_only=False):
+        self.config = config
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        # hilo -> (conexión, momento en que se devolvió al pool)
+        self._idle = {}
+        self._in_use = {}
+        self._stats = dict.fromkeys(
+            ('opened', 'reused', 'closed', 'overflow', 'discarded'), 0
         )
-        g.db.row_factory = sqlite3.Row
+
+    @property
+    def size(self):
+        return self.config['DB_POOL_SIZE']
+
+    def acquire(self):
+        thread = threading.current_thread()
+        with self._lock:
+            conn, released = self._idle.pop(thread, (None, None))
+
+        if conn is not None:
+            if self._healthy(conn, released):
+                self._count('reused')
+                with self._lock:
+                    self._in_use[thread] = conn
+                return conn
+            self._discard(conn)
+
+        with self._lock:
+            self._prune()
+            pooled = (
+                thread not in self._in_use
+                and len(self._idle) + len(self._in_use) < self.size
+            )
+            if pooled:
+                # se reserva el sitio antes de conectar
+                self._in_use[thread] = None
+
+        try:
+            conn = connect(self.config, self.read_only)
+        except Exception:
+            if pooled:
+                with self._lock:
+                    self._in_use.pop(thread, None)
+            raise
+
+        self._count('opened')
+        if pooled:
+            with self._lock:
+                self._in_use[thread] = conn
+        else:
+            self._count('overflow')
+        return conn
+
+    def release(self, conn):
+        thread = threading.current_thread()
+        with self._lock:
+            pooled = self._in_use.get(thread) is conn
+            if pooled:
+                del self._in_use[thread]
+                # el tamaño puede haber bajado desde que se abrió
+                pooled = len(self._idle) + len(self._in_use) < self.size
+
+        if not pooled:
+            self._close(conn)
+            return
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        with self._lock:
+            self._idle[thread] = (conn, time.monotonic())
+
+    def close_all(self):
+        with self._lock:
+            conns = [conn for conn, released in self._idle.values()]
+            self._idle.clear()
+        for conn in conns:
+            self._close(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = len(self._in_use)
+        stats['size'] = self.size
+        return stats
+
+    def _healthy(self, conn, released):
+        # solo se comprueba si la conexión lleva un rato sin usarse
+        interval = self.config['DB_POOL_HEALTHCHECK_INTERVAL']
+        if time.monotonic() - released < interval:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def _prune(self):
+        # conexiones de hilos que ya no existen (llamar con el lock)
+        for thread in [t for t in self._idle if not t.is_alive()]:
+            conn, released = self._idle.pop(thread)
+            self._stats['closed'] += 1
+            conn.close()
+
+    def _discard(self, conn):
+        self._count('discarded')
+        self._close(conn)
+
+    def _close(self, conn):
+        self._count('closed')
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+def _read_only_uri(database):
+    '''Ruta o URI de la bd -> URI para abrirla en solo lectura.'''
+    if database.startswith('file:'):
+        # las bd en memoria no admiten mode=ro: query_only basta
+        if 'mode=' in database:
+            return database
+        separator = '&' if '?' in database else '?'
+        return f'{database}{separator}mode=ro'
+    return Path(os.path.abspath(database)).as_uri() + '?mode=ro'
+
+def connect(config, read_only=False):
+    '''
+    Abre una conexión nueva con los PRAGMA configurados en app.config.
+    - check_same_thread=False porque el pool garantiza que cada conexión
+    solo la usa un hilo a la vez, pero puede cerrarla otro hilo.
+    - cached_statements es el tamaño de la caché de sentencias preparadas.
+    - con METRICS_ENABLED las conexiones se instrumentan (ver flaskr.metrics)
+    - DATABASE puede ser una URI "file:..." (p. ej. las bd en memoria
+    compartidas de los tests, file:nombre?mode=memory&cache=shared)
+    - read_only abre READ_DATABASE (o DATABASE) con mode=ro y query_only:
+    la conexión no puede escribir ni coger el bloqueo de escritura
+    '''
+    factory = sqlite3.Connection
+    if config.get('METRICS_ENABLED'):
+        factory = InstrumentedConnection
+    database = config['DATABASE']
+    if read_only:
+        database = _read_only_uri(config.get('READ_DATABASE') or database)
+    conn = sqlite3.connect(
+        database,
+        uri=database.startswith('file:'),
+        factory=factory,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=config['DB_BUSY_TIMEOUT'] / 1000,
+        cached_statements=config['DB_STATEMENT_CACHE_SIZE'],
+        check_same_thread=False,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {int(config['DB_BUSY_TIMEOUT'])}")
+    if read_only:
+        # el modo del journal lo pone la conexión de escritura
+        conn.execute('PRAGMA query_only = ON')
+    elif config['DB_JOURNAL_MODE']:
+        conn.execute(f"PRAGMA journal_mode = {config['DB_JOURNAL_MODE']}")
+    if config['DB_SYNCHRONOUS']:
+        conn.execute(f"PRAGMA synchronous = {config['DB_SYNCHRONOUS']}")
+    conn.execute(f"PRAGMA mmap_size = {int(config['DB_MMAP_SIZE'])}")
+    conn.execute(f"PRAGMA cache_size = {int(config['DB_CACHE_SIZE'])}")
+    return conn
+
+def get_pools(app=None):
+    '''
+    Pools por papel: 'write' y 'read'. Se crean la primera vez que se piden,
+    cuando la configuración ya es la definitiva (create_app puede recibir un
+    test_config).
+    '''
+    if app is None:
+        app = current_app._get_current_object()
+    pools = app.extensions.get('flaskr.db')
+    if pools is None:
+        pools = app.extensions.setdefault('flaskr.db', {
+            'write': ConnectionPool(app.config),
+            'read': ConnectionPool(app.config, read_only=True),
+        })
+    return pools
+
+def get_pool(app=None, role='write'):
+    return get_pools(app)[role]
+
+def get_write_db():
+    '''Conexión para escribir (y para leer lo que se acaba de escribir).'''
+    if 'db' not in g:
+        g.db = get_pool().acquire()
 
     return g.db
 
+def get_read_db():
+    '''
+    Conexión de solo lectura para las consultas de las vistas. En WAL las
+    lecturas no bloquean a la conexión de escritura ni esperan por ella, y
+    con READ_DATABASE se pueden mandar a una copia de la bd.
+    '''
+    if 'read_db' not in g:
+        g.read_db = get_pool(role='read').acquire()
+
+    return g.read_db
+
+# el nombre de siempre: la conexión de escritura
+get_db = get_write_db
+
 def close_db(e=None):
-    db = g.pop('db', None)
+    for name, role in (('db', 'write'), ('read_db', 'read')):
+        db = g.pop(name, None)
+        if db is not None:
+            get_pool(role=role).release(db)
 
-    if db is not None:
-        db.close()
+def iter_rows(cursor, size=1000):
+    '''
+    Recorre un cursor por bloques de `size` filas con fetchmany, para no
+    cargar el resultado entero en memoria.
+    '''
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        yield from rows
 
 def init_db():
     db = get_db()
@@ -50,6 +285,26 @@ sqlite3.register_converter(
     "timestamp", lambda v: datetime.fromisoformat(v.decode())
 )
 
+# valores por defecto de la conexión, se pueden sobreescribir en config.py
+DEFAULT_CONFIG = {
+    # conexiones reutilizables por proceso (0 desactiva el pool)
+    'DB_POOL_SIZE': 8,
+    # segundos sin usar tras los que se comprueba la conexión con un SELECT 1
+    'DB_POOL_HEALTHCHECK_INTERVAL': 30,
+    # WAL deja leer mientras otro escribe, NORMAL solo hace fsync al checkpoint
+    'DB_JOURNAL_MODE': 'WAL',
+    'DB_SYNCHRONOUS': 'NORMAL',
+    'DB_MMAP_SIZE': 64 * 1024 * 1024,
+    # negativo = KiB (16 MiB)
+    'DB_CACHE_SIZE': -16000,
+    # milisegundos que se espera a un bloqueo antes de 'database is locked'
+    'DB_BUSY_TIMEOUT': 5000,
+    'DB_STATEMENT_CACHE_SIZE': 128,
+    # bd de la que leen las conexiones de get_read_db (p. ej. una réplica);
+    # None = la misma DATABASE
+    'READ_DATABASE': None,
+}
+
 def init_app(app):
     '''
     - teardown_appcontext: llama a la función close_db cuando desaparece el
@@ -57,5 +312,7 @@ def init_app(app):
     - cli.add_command añade una nueva orden que se puede ejecutar en la terminal
     junto al comando de flask
     '''
+    for key, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(key, value)
     app.teardown_appcontext(close_db) 
     app.cli.add_command(init_db_command)
\ No newline at end of file
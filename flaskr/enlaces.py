@@ -0,0 +1,334 @@
+'''
+Enlaces compartidos.
+Cada URL se normaliza (canonicalize_url) y se guarda con un hash de 64 bits
+de la forma canónica en una columna con índice único, así que saber si un
+enlace ya se había compartido es una sola búsqueda por índice. Si se vuelve
+a compartir, no se inserta otra fila: se suma uno a `compartido`.
+
+Cada enlace tiene además una URL corta /l/<código>, donde el código es su id
+en base62. Las redirecciones salen de una LRU en memoria y los clics se
+cuentan en memoria (ClickBuffer) y se escriben en la bd sumados, cada
+CLICK_FLUSH_INTERVAL segundos, con un solo executemany.
+'''
+import atexit
+import hashlib
+import logging
+import string
+import threading
+import weakref
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from flask import (
+    Blueprint, abort, current_app, flash, g, redirect, render_template, url_for
+)
+
+from flaskr.auth import login_required
+from flaskr.blog import cursor_args, keyset_page
+from flaskr.cache import LRUCache, get_cache, register_cache
+from flaskr.db import connect, get_read_db
+from flaskr.forms import EnlaceForm
+from flaskr.writer import write
+
+bp = Blueprint('enlaces', __name__, url_prefix='/enlaces')
+short_bp = Blueprint('cortos', __name__, url_prefix='/l')
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# parámetros de seguimiento que no cambian la página a la que apunta el enlace
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid',
+    'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'ref_src',
+}
+
+def _is_tracking(name):
+    name = name.lower()
+    return name.startswith('utm_') or name in TRACKING_PARAMS
+
+def canonicalize_url(url):
+    '''
+    Forma canónica de una URL http(s):
+    - esquema y host en minúsculas (host en IDNA) y sin el puerto por defecto
+    - sin fragmento (#...) ni barra final en la ruta (salvo la raíz)
+    - sin parámetros de seguimiento (utm_*, fbclid...) y el resto ordenados
+    Lanza ValueError si la URL no es http(s) o no tiene host.
+    '''
+    url = url.strip()
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        raise ValueError(f'URL no válida: {url}')
+
+    host = parts.hostname.rstrip('.').encode('idna').decode('ascii')
+    if ':' in host:
+        host = f'[{host}]' # IPv6
+    port = parts.port
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = f'{host}:{port}'
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo += ':' + parts.password
+        host = f'{userinfo}@{host}'
+
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking(name)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+def url_hash(canonical_url):
+    '''Los primeros 8 bytes del sha256 como entero con signo (cabe en un INTEGER).'''
+    digest = hashlib.sha256(canonical_url.encode('utf8')).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+# INSERT que fusiona los duplicados; si dos URLs distintas tuvieran los mismos
+# 64 bits de hash, el WHERE hace que no se toque la fila existente
+UPSERT_ENLACE_SQL = (
+    'INSERT INTO enlaces (author_id, url_enlace, url_canonica, url_hash, created)'
+    ' VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))'
+    ' ON CONFLICT (url_hash) DO UPDATE SET compartido = compartido + 1'
+    ' WHERE url_canonica = excluded.url_canonica'
+)
+
+def enlace_params(url, author_id, created=None):
+    '''Parámetros de UPSERT_ENLACE_SQL para una URL.'''
+    canonical = canonicalize_url(url)
+    return (author_id, url.strip(), canonical, url_hash(canonical), created)
+
+def add_enlace(db, url, author_id):
+    '''
+    Guarda el enlace o, si ya existía, le suma una vez más compartido.
+    Es un único INSERT ... ON CONFLICT sobre el índice de url_hash.
+    Devuelve (id, nuevo). No hace commit.
+    '''
+    params = enlace_params(url, author_id)
+    row = db.execute(
+        UPSERT_ENLACE_SQL + ' RETURNING id, compartido', params
+    ).fetchone()
+    if row is None:
+        # dos URLs distintas con los mismos 64 bits de hash
+        raise ValueError(f'colisión de hash para {params[2]}')
+    return row['id'], row['compartido'] == 1
+
+def find_enlace(db, url):
+    canonical = canonicalize_url(url)
+    return db.execute(
+        'SELECT * FROM enlaces WHERE url_hash = ? AND url_canonica = ?',
+        (url_hash(canonical), canonical)
+    ).fetchone()
+
+BASE62 = string.digits + string.ascii_lowercase + string.ascii_uppercase
+
+# id más alta que admite una columna INTEGER de sqlite
+MAX_ID = 2 ** 63 - 1
+
+def encode_code(id):
+    '''id del enlace -> código base62 de la URL corta (1 -> "1", 62 -> "10").'''
+    if id < 0:
+        raise ValueError('id negativa')
+    code = ''
+    while True:
+        id, digit = divmod(id, 62)
+        code = BASE62[digit] + code
+        if not id:
+            return code
+
+def decode_code(code):
+    '''
+    Lanza ValueError si el código no es base62, no es canónico ("01") o
+    pasa del máximo INTEGER de sqlite (2**63 - 1), que cabe en 11 cifras
+    pero no todos los de 11 cifras caben en él.
+    '''
+    if not code or len(code) > 11 or (len(code) > 1 and code[0] == '0'):
+        raise ValueError(f'código no válido: {code}')
+    id = 0
+    for char in code:
+        digit = BASE62.find(char)
+        if digit < 0:
+            raise ValueError(f'código no válido: {code}')
+        id = id * 62 + digit
+    if id > MAX_ID:
+        raise ValueError(f'código no válido: {code}')
+    return id
+
+class ClickBuffer(object):
+    '''
+    Clics por enlace acumulados en memoria. flush() los escribe sumados con
+    un UPDATE por enlace en una sola transacción; un hilo lo llama cada
+    `interval` segundos con su propia conexión. Si la escritura falla los
+    clics se devuelven al buffer para el siguiente intento.
+    '''
+
+    def __init__(self, config, interval=5):
+        self.config = config
+        self.interval = interval
+        self.flushed = 0
+        self.flushes = 0
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def add(self, id, count=1):
+        with self._lock:
+            self._counts[id] = self._counts.get(id, 0) + count
+        self._start()
+
+    def pending(self):
+        with self._lock:
+            return sum(self._counts.values())
+
+    def flush(self, db=None):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        if not counts:
+            return 0
+        close = db is None
+        try:
+            if db is None:
+                db = connect(self.config)
+            with db:
+                db.executemany(
+                    'UPDATE enlaces SET clicks = clicks + ? WHERE id = ?',
+                    [(count, id) for id, count in counts.items()]
+                )
+        except Exception:
+            with self._lock:
+                for id, count in counts.items():
+                    self._counts[id] = self._counts.get(id, 0) + count
+            raise
+        finally:
+            if close and db is not None:
+                db.close()
+        total = sum(counts.values())
+        self.flushed += total
+        self.flushes += 1
+        return total
+
+    def stop(self):
+        '''Para el hilo y escribe lo que quede.'''
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def stats(self):
+        return {
+            'pending': self.pending(), 'flushed': self.flushed,
+            'flushes': self.flushes,
+        }
+
+    def _start(self):
+        if self._thread is None and self.interval:
+            with self._lock:
+                if self._thread is None:
+                    self._stop.clear()
+                    self._thread = threading.Thread(
+                        target=self._loop, name='flaskr-clicks', daemon=True
+                    )
+                    self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('no se han podido guardar los clics')
+
+# buffers de las apps que siguen vivas; al salir se escribe lo que quede en
+# cada uno. Es un WeakSet para que registrar el buffer no mantenga viva la
+# app (los tests y el benchmark crean muchas)
+_click_buffers = weakref.WeakSet()
+
+@atexit.register
+def _stop_click_buffers():
+    for clicks in list(_click_buffers):
+        try:
+            clicks.stop()
+        except Exception:
+            logger.exception('no se han podido guardar los clics al salir')
+
+def get_click_buffer():
+    return current_app.extensions['flaskr.clicks']
+
+@short_bp.route('/<code>')
+def follow(code):
+    '''
+    Redirige a la URL del enlace. El destino sale de la caché 'short_links'
+    y el clic solo se suma en memoria, así que una redirección de un enlace
+    popular no toca la bd.
+    '''
+    try:
+        id = decode_code(code)
+    except ValueError:
+        abort(404)
+    cache = get_cache('short_links')
+    url = cache.get(id)
+    if url is None:
+        row = get_read_db().execute(
+            'SELECT url_canonica FROM enlaces WHERE id = ?', (id,)
+        ).fetchone()
+        if row is None:
+            abort(404)
+        url = row['url_canonica']
+        cache.set(id, url)
+    get_click_buffer().add(id)
+    return redirect(url, code=302)
+
+ENLACE_LIST_SQL = (
+    'SELECT e.id, url_enlace, url_canonica, compartido, clicks, created,'
+    ' username, m.title, m.description, m.favicon'
+    ' FROM enlaces e JOIN user u ON e.author_id = u.id'
+    ' LEFT JOIN enlace_metadata m ON m.enlace_id = e.id'
+)
+
+@bp.route('/')
+def index():
+    before, after = cursor_args()
+    enlaces, prev_cursor, next_cursor = keyset_page(
+        ENLACE_LIST_SQL, 'e', before=before, after=after
+    )
+    return render_template(
+        'enlaces/index.html', enlaces=enlaces,
+        prev_cursor=prev_cursor, next_cursor=next_cursor
+    )
+
+@bp.route('/create', methods=('GET', 'POST'))
+@login_required
+def create():
+    form = EnlaceForm()
+    if form.validate_on_submit():
+        try:
+            id, nuevo = write(add_enlace, form.url.data, g.user['id'])
+        except ValueError as e:
+            form.url.errors.append(str(e))
+        else:
+            if not nuevo:
+                flash('Este enlace ya estaba compartido.')
+            return redirect(url_for('enlaces.index'))
+
+    return render_template('enlaces/create.html', form=form)
+
+def init_app(app):
+    app.config.setdefault('SHORT_LINK_CACHE_SIZE', 10000)
+    # 0 desactiva el hilo (los clics se escriben al llamar a flush o al salir)
+    app.config.setdefault('CLICK_FLUSH_INTERVAL', 5)
+    register_cache(
+        app, 'short_links', LRUCache(app.config['SHORT_LINK_CACHE_SIZE'])
+    )
+    clicks = ClickBuffer(app.config, app.config['CLICK_FLUSH_INTERVAL'])
+    app.extensions['flaskr.clicks'] = clicks
+    _click_buffers.add(clicks)
+    app.jinja_env.filters['short_code'] = encode_code
+    app.register_blueprint(bp)
+    app.register_blueprint(short_bp)
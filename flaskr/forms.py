@@ -18,4 +18,8 @@ class PostForm(FlaskForm):
     title = StringField('Título', validators=[DataRequired(), Length(max=128)])
     title_slug = StringField('Título slug', validators=[Length(max=128)])
     content = TextAreaField('Contenido del post')
-    submit = SubmitField('Publicar')
\ No newline at end of file
+    submit = SubmitField('Publicar')
+
+class EnlaceForm(FlaskForm):
+    url = StringField('URL', validators=[DataRequired(), Length(max=2048)])
+    submit = SubmitField('Compartir')
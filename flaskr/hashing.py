@@ -0,0 +1,125 @@
+'''
+Hash de contraseñas fuera del hilo de la petición.
+scrypt (el método por defecto de Werkzeug) gasta decenas de milisegundos de
+CPU en cada hash; aquí se hace en un pool de procesos acotado para que las
+ráfagas de login y registro no dejen sin CPU al resto de peticiones. Si el
+pool y su cola están llenos se contesta enseguida con un 429 (HashingBusy)
+en lugar de acumular peticiones esperando.
+
+Configuración:
+- PASSWORD_HASH_METHOD: método y coste en el formato de Werkzeug
+('scrypt', 'scrypt:65536:8:1', 'pbkdf2:sha256:600000'...)
+- HASH_POOL_WORKERS: procesos del pool (0 hace el hash en el propio hilo)
+- HASH_QUEUE_SIZE: hashes que pueden esperar a un proceso libre
+- HASH_TIMEOUT: segundos máximos de espera por un hash (si pasan, 503)
+'''
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+from flask import current_app, has_app_context
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+from werkzeug.security import check_password_hash, generate_password_hash
+
+class HashingBusy(TooManyRequests):
+    description = 'Demasiados intentos a la vez, vuelve a probar en unos segundos.'
+
+class HashingTimeout(ServiceUnavailable):
+    description = 'El servidor está muy ocupado, vuelve a probar en unos segundos.'
+
+class HashingService(object):
+
+    def __init__(self, method='scrypt', workers=0, queue_size=16, timeout=10):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + queue_size)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._prefix = None
+
+    def _get_executor(self):
+        # los procesos se arrancan con el primer hash, no al crear la app;
+        # spawn porque hacer fork de un proceso con hilos no es seguro
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+        return self._executor
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy(retry_after=1)
+        if self.workers <= 0:
+            try:
+                return function(*args)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._get_executor().submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # el hueco se libera cuando el hash termina, no cuando nos cansamos
+        # de esperar: si no, tras unos cuantos timeouts habría más trabajos
+        # en el pool de los que permite la cola
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # si todavía no había empezado ya no hace falta hacerlo
+            future.cancel()
+            raise HashingTimeout(retry_after=1)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        '''
+        True si el hash guardado no usa el método y coste configurados.
+        Se compara la parte antes del primer $ con la de un hash hecho con
+        PASSWORD_HASH_METHOD, que ya lleva los parámetros por defecto
+        ('scrypt' -> 'scrypt:32768:8:1').
+        '''
+        if self._prefix is None:
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return pwhash.split('$', 1)[0] != self._prefix
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+def get_hasher():
+    return current_app.extensions['flaskr.hashing']
+
+def hash_password(password):
+    '''Usa el servicio de la app si hay contexto; si no, hashea aquí mismo.'''
+    if has_app_context():
+        return get_hasher().hash(password)
+    return generate_password_hash(password)
+
+def check_password(pwhash, password):
+    if has_app_context():
+        return get_hasher().verify(pwhash, password)
+    return check_password_hash(pwhash, password)
+
+def init_app(app):
+    app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+    app.config.setdefault('HASH_POOL_WORKERS', min(os.cpu_count() or 1, 4))
+    app.config.setdefault('HASH_QUEUE_SIZE', 16)
+    app.config.setdefault('HASH_TIMEOUT', 10)
+    app.extensions['flaskr.hashing'] = HashingService(
+        app.config['PASSWORD_HASH_METHOD'],
+        app.config['HASH_POOL_WORKERS'],
+        app.config['HASH_QUEUE_SIZE'],
+        app.config['HASH_TIMEOUT'],
+    )
@@ -0,0 +1,282 @@
+'''
+Título, descripción y favicon de los enlaces compartidos.
+Descargar la página dentro de la petición haría que compartir un enlace
+tardase lo que tarde la web más lenta, así que se hace aparte:
+
+    flask fetch-metadata            # se queda esperando enlaces nuevos
+    flask fetch-metadata --once     # procesa lo pendiente y termina
+
+La cola es la tabla enlace_metadata: un trigger añade una fila por cada
+enlace nuevo y next_fetch dice cuándo toca descargarlo. El worker coge un
+lote de filas vencidas, las descarga con asyncio (urllib en hilos con
+asyncio.to_thread) con un máximo de METADATA_CONCURRENCY a la vez y como
+mucho una petición cada METADATA_HOST_INTERVAL segundos al mismo host, y
+escribe los resultados del lote en una sola transacción.
+- los resultados valen METADATA_TTL segundos; al volver a pedir la página
+se manda If-None-Match / If-Modified-Since y un 304 solo renueva la fecha
+- los errores se reintentan con espera exponencial
+- por defecto no se descargan direcciones privadas o locales
+(METADATA_ALLOW_PRIVATE) para que no se pueda usar contra la red interna
+'''
+import asyncio
+import ipaddress
+import socket
+import time
+import urllib.error
+import urllib.request
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from flaskr.db import get_db
+
+USER_AGENT = 'flaskr-metadata/1.0'
+
+# de cada página solo se lee el principio, donde está el <head>
+MAX_BYTES = 256 * 1024
+
+# segundos que un lote cogido por un worker queda reservado
+LEASE = 300
+
+DEFAULT_CONFIG = {
+    'METADATA_BATCH_SIZE': 50,
+    'METADATA_CONCURRENCY': 8,
+    'METADATA_HOST_INTERVAL': 1.0,
+    'METADATA_TIMEOUT': 10,
+    'METADATA_TTL': 7 * 24 * 3600,
+    'METADATA_POLL_INTERVAL': 10,
+    'METADATA_ALLOW_PRIVATE': False,
+}
+
+class MetadataParser(HTMLParser):
+    '''Saca title, description y favicon del <head> de una página.'''
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = None
+        self.og_title = None
+        self.description = None
+        self.favicon = None
+        self._in_title = False
+        self._title_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or '' for name, value in attrs}
+        if tag == 'title' and self.title is None:
+            self._in_title = True
+        elif tag == 'meta':
+            name = (attrs.get('name') or attrs.get('property') or '').lower()
+            content = attrs.get('content', '').strip()
+            if name in ('description', 'og:description') and content:
+                self.description = self.description or content
+            elif name == 'og:title' and content:
+                self.og_title = content
+        elif tag == 'link' and self.favicon is None:
+            rel = attrs.get('rel', '').lower().split()
+            if 'icon' in rel and attrs.get('href'):
+                self.favicon = attrs['href']
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._in_title:
+            self._in_title = False
+            self.title = ' '.join(''.join(self._title_parts).split())
+
+def parse_metadata(html, base_url):
+    parser = MetadataParser()
+    parser.feed(html)
+    parser.close()
+    title = parser.title or parser.og_title
+    return {
+        'title': title[:300] if title else None,
+        'description': parser.description[:1000] if parser.description else None,
+        'favicon': urljoin(base_url, parser.favicon or '/favicon.ico'),
+    }
+
+def check_public(url):
+    '''Lanza ValueError si el host de la URL resuelve a una dirección privada.'''
+    host = urlsplit(url).hostname
+    if host is None:
+        raise ValueError(f'URL sin host: {url}')
+    for info in socket.getaddrinfo(host, None):
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if not address.is_global:
+            raise ValueError(f'{host} es una dirección privada')
+
+class _PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+def fetch_page(url, etag=None, last_modified=None, timeout=10,
+               allow_private=False):
+    '''
+    Descarga la página (bloquea: se llama desde un hilo). Devuelve un
+    diccionario con status 'ok' (y los metadatos, etag y last_modified),
+    'not_modified' si el servidor contesta 304 o 'error' con el motivo.
+    '''
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if last_modified:
+        request.add_header('If-Modified-Since', last_modified)
+    if allow_private:
+        opener = urllib.request.build_opener()
+    else:
+        opener = urllib.request.build_opener(_PublicRedirectHandler)
+
+    try:
+        if not allow_private:
+            check_public(url)
+        with opener.open(request, timeout=timeout) as response:
+            content_type = response.headers.get_content_type()
+            if content_type not in ('text/html', 'application/xhtml+xml'):
+                return {'status': 'error', 'error': f'tipo {content_type}'}
+            charset = response.headers.get_content_charset() or 'utf-8'
+            html = response.read(MAX_BYTES).decode(charset, 'replace')
+            result = parse_metadata(html, response.geturl())
+            result.update(
+                status='ok',
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+            )
+            return result
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return {'status': 'not_modified'}
+        return {'status': 'error', 'error': f'HTTP {e.code}'}
+    except (OSError, ValueError, LookupError) as e:
+        # URLError, timeouts, errores de DNS, charset desconocido...
+        return {'status': 'error', 'error': str(e) or type(e).__name__}
+
+class HostLimiter(object):
+    '''Deja pasar como mucho una petición cada `interval` segundos por host.'''
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next = {}
+        self._locks = {}
+
+    async def wait(self, host):
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next.get(host, 0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next[host] = loop.time() + self.interval
+
+async def fetch_all(rows, concurrency, host_interval, timeout, allow_private):
+    '''Descarga las filas del lote; devuelve [(fila, resultado)].'''
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = HostLimiter(host_interval)
+
+    async def fetch(row):
+        # se espera el turno del host antes de ocupar un hueco del semáforo
+        await limiter.wait(urlsplit(row['url_canonica']).hostname)
+        async with semaphore:
+            result = await asyncio.to_thread(
+                fetch_page, row['url_canonica'], row['etag'],
+                row['last_modified'], timeout, allow_private
+            )
+        return row, result
+
+    return await asyncio.gather(*(fetch(row) for row in rows))
+
+def claim_batch(db, size):
+    '''
+    Coge hasta `size` enlaces vencidos y los reserva LEASE segundos, para
+    que otro worker no los descargue a la vez.
+    '''
+    db.execute('BEGIN IMMEDIATE')
+    rows = db.execute(
+        'SELECT m.enlace_id, m.etag, m.last_modified, m.attempts, e.url_canonica'
+        ' FROM enlace_metadata m JOIN enlaces e ON e.id = m.enlace_id'
+        ' WHERE m.next_fetch <= CURRENT_TIMESTAMP'
+        ' ORDER BY m.next_fetch LIMIT ?',
+        (size,)
+    ).fetchall()
+    db.executemany(
+        "UPDATE enlace_metadata SET next_fetch = datetime('now', ?)"
+        ' WHERE enlace_id = ?',
+        [(f'+{LEASE} seconds', row['enlace_id']) for row in rows]
+    )
+    db.commit()
+    return rows
+
+def save_results(db, results, ttl):
+    '''Escribe los resultados del lote en una transacción.'''
+    ok, not_modified, errors = [], [], []
+    for row, result in results:
+        if result['status'] == 'ok':
+            ok.append((
+                result['title'], result['description'], result['favicon'],
+                result['etag'], result['last_modified'], f'+{ttl} seconds',
+                row['enlace_id'],
+            ))
+        elif result['status'] == 'not_modified':
+            not_modified.append((f'+{ttl} seconds', row['enlace_id']))
+        else:
+            # 1 min, 2 min, 4 min... hasta el TTL
+            retry = min(60 * 2 ** row['attempts'], ttl)
+            errors.append((result['error'][:500], f'+{retry} seconds', row['enlace_id']))
+
+    db.executemany(
+        "UPDATE enlace_metadata SET status = 'ok', title = ?, description = ?,"
+        ' favicon = ?, etag = ?, last_modified = ?, error = NULL, attempts = 0,'
+        " fetched = CURRENT_TIMESTAMP, next_fetch = datetime('now', ?)"
+        ' WHERE enlace_id = ?',
+        ok
+    )
+    db.executemany(
+        'UPDATE enlace_metadata SET attempts = 0, fetched = CURRENT_TIMESTAMP,'
+        " next_fetch = datetime('now', ?) WHERE enlace_id = ?",
+        not_modified
+    )
+    db.executemany(
+        "UPDATE enlace_metadata SET status = 'error', error = ?,"
+        " attempts = attempts + 1, next_fetch = datetime('now', ?)"
+        ' WHERE enlace_id = ?',
+        errors
+    )
+    db.commit()
+    return len(ok), len(not_modified), len(errors)
+
+def process_batch(size=None):
+    '''Coge, descarga y guarda un lote. Devuelve cuántos enlaces ha procesado.'''
+    config = current_app.config
+    db = get_db()
+    rows = claim_batch(db, size or config['METADATA_BATCH_SIZE'])
+    if not rows:
+        return 0
+    results = asyncio.run(fetch_all(
+        rows, config['METADATA_CONCURRENCY'], config['METADATA_HOST_INTERVAL'],
+        config['METADATA_TIMEOUT'], config['METADATA_ALLOW_PRIVATE'],
+    ))
+    ok, not_modified, errors = save_results(db, results, config['METADATA_TTL'])
+    click.echo(
+        f'{len(rows)} enlaces: {ok} nuevos, {not_modified} sin cambios,'
+        f' {errors} errores'
+    )
+    return len(rows)
+
+@click.command('fetch-metadata')
+@click.option('--once', is_flag=True, help='Termina cuando no queda nada pendiente.')
+@click.option('--batch-size', type=click.IntRange(min=1), default=None,
+              help='Enlaces por lote (METADATA_BATCH_SIZE).')
+@with_appcontext
+def fetch_metadata_command(once, batch_size):
+    '''Descarga título, descripción y favicon de los enlaces pendientes.'''
+    while True:
+        if process_batch(batch_size):
+            continue
+        if once:
+            break
+        time.sleep(current_app.config['METADATA_POLL_INTERVAL'])
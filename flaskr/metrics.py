@@ -0,0 +1,336 @@
+'''
+Instrumentación de peticiones y de SQL.
+- Las conexiones que abre flaskr.db son InstrumentedConnection: cuentan las
+sentencias (con el trace callback de sqlite), miden lo que tarda cada
+execute y las filas que se leen de los cursores.
+- Cada petición mide su latencia por endpoint.
+Todo se acumula en un Registry por aplicación que se exporta en formato
+texto de Prometheus en /metrics. Las sentencias que tardan más de
+SLOW_QUERY_MS se registran como warning en el logger de la app.
+'''
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Blueprint, Response, current_app, g, has_app_context, request
+
+bp = Blueprint('metrics', __name__)
+
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5
+)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+class Counter(object):
+
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield self.name + _format_labels(self.labels, labels), value
+
+class Gauge(Counter):
+
+    type = 'gauge'
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram(object):
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [contador por bucket..., suma, total]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        # cada observación va a un solo bucket; se acumulan al exportar
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(labels)
+            if data is None:
+                data = self._values[labels] = [0] * (len(self.buckets) + 3)
+            data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def count(self, *labels):
+        data = self._values.get(labels)
+        return data[-1] if data else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((k, list(v)) for k, v in self._values.items())
+        for labels, data in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), data):
+                cumulative += count
+                le = (('le', bound),)
+                yield (
+                    self.name + '_bucket' + _format_labels(self.labels, labels, le),
+                    cumulative
+                )
+            yield self.name + '_sum' + _format_labels(self.labels, labels), data[-2]
+            yield self.name + '_count' + _format_labels(self.labels, labels), data[-1]
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+        self.sql_statements = self.add(Counter(
+            'flaskr_sql_statements_total', 'Sentencias SQL ejecutadas.'
+        ))
+        self.sql_seconds = self.add(Histogram(
+            'flaskr_sql_execute_seconds', 'Latencia de cada execute SQL.'
+        ))
+        self.sql_rows = self.add(Counter(
+            'flaskr_sql_rows_total', 'Filas leídas de los cursores.'
+        ))
+        self.slow_queries = self.add(Counter(
+            'flaskr_sql_slow_queries_total',
+            'Sentencias más lentas que SLOW_QUERY_MS.'
+        ))
+        self.request_seconds = self.add(Histogram(
+            'flaskr_request_seconds', 'Latencia de las peticiones.',
+            labels=('endpoint', 'method')
+        ))
+        self.request_statements = self.add(Histogram(
+            'flaskr_request_sql_statements', 'Sentencias SQL por petición.',
+            labels=('endpoint',), buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100)
+        ))
+        self.requests = self.add(Counter(
+            'flaskr_requests_total', 'Peticiones servidas.',
+            labels=('endpoint', 'status')
+        ))
+        self.db_pool = self.add(Gauge(
+            'flaskr_db_pool', 'Estado de los pools de conexiones sqlite.',
+            labels=('role', 'stat')
+        ))
+        self.write_queue = self.add(Gauge(
+            'flaskr_write_queue', 'Lotes y operaciones de la cola de escritura.',
+            labels=('stat',)
+        ))
+        self.caches = self.add(Gauge(
+            'flaskr_cache', 'Aciertos, fallos y tamaño de las cachés.',
+            labels=('cache', 'stat')
+        ))
+        self.ratelimit = self.add(Gauge(
+            'flaskr_ratelimit', 'Intentos comprobados y rechazados por el límite.',
+            labels=('stat',)
+        ))
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for name, value in metric.samples():
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+def get_registry(app=None):
+    if app is None:
+        app = current_app
+    return app.extensions['flaskr.metrics']
+
+def _current_registry():
+    # las conexiones también se usan fuera de Flask (tests, hilos propios)
+    if has_app_context():
+        return current_app.extensions.get('flaskr.metrics')
+    return None
+
+def _request_stats():
+    if has_app_context():
+        return g.get('_sql_stats')
+    return None
+
+class InstrumentedCursor(sqlite3.Cursor):
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _record_execute(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            _record_execute(sql, time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            _record_execute(sql_script, time.perf_counter() - start)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            _record_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        _record_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        _record_rows(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        _record_rows(1)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    '''
+    Conexión sqlite que pasa todas las sentencias por InstrumentedCursor.
+    Se usa como `factory` de sqlite3.connect.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_trace)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+def _trace(statement):
+    # sqlite avisa también de los triggers como "-- TRIGGER nombre"
+    if statement.startswith('--'):
+        return
+    registry = _current_registry()
+    if registry is not None:
+        registry.sql_statements.inc()
+    stats = _request_stats()
+    if stats is not None:
+        stats['statements'] += 1
+
+def _record_execute(sql, elapsed):
+    registry = _current_registry()
+    if registry is None:
+        return
+    registry.sql_seconds.observe(elapsed)
+    stats = _request_stats()
+    if stats is not None:
+        stats['seconds'] += elapsed
+
+    threshold = current_app.config['SLOW_QUERY_MS']
+    if threshold is not None and elapsed * 1000 >= threshold:
+        registry.slow_queries.inc()
+        current_app.logger.warning(
+            'consulta lenta (%.1f ms): %s', elapsed * 1000, ' '.join(sql.split())[:500]
+        )
+
+def _record_rows(count):
+    registry = _current_registry()
+    if registry is not None and count:
+        registry.sql_rows.inc(count)
+    stats = _request_stats()
+    if stats is not None:
+        stats['rows'] += count
+
+def start_request_timer():
+    g._request_start = time.perf_counter()
+    g._sql_stats = {'statements': 0, 'seconds': 0.0, 'rows': 0}
+
+def record_request(response):
+    start = g.pop('_request_start', None)
+    if start is None:
+        return response
+    endpoint = request.endpoint or 'none'
+    registry = get_registry()
+    registry.request_seconds.observe(
+        time.perf_counter() - start, endpoint, request.method
+    )
+    registry.request_statements.observe(g._sql_stats['statements'], endpoint)
+    registry.requests.inc(1, endpoint, str(response.status_code))
+    return response
+
+@bp.route('/metrics')
+def metrics():
+    registry = get_registry()
+    for role, pool in current_app.extensions.get('flaskr.db', {}).items():
+        for stat, value in pool.stats().items():
+            registry.db_pool.set(value, role, stat)
+    writer = current_app.extensions.get('flaskr.writer')
+    if writer is not None:
+        for stat, value in writer.stats().items():
+            registry.write_queue.set(value, stat)
+    limiter = current_app.extensions.get('flaskr.ratelimit')
+    if limiter is not None:
+        for stat, value in limiter.stats().items():
+            registry.ratelimit.set(value, stat)
+    for name, cache in current_app.extensions.get('flaskr.caches', {}).items():
+        for stat, value in cache.stats().items():
+            registry.caches.set(value, name, stat)
+    return Response(
+        registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+def init_app(app):
+    '''
+    - METRICS_ENABLED=False deja las conexiones sin instrumentar y quita /metrics
+    - SLOW_QUERY_MS=None desactiva el log de consultas lentas
+    '''
+    app.config.setdefault('METRICS_ENABLED', True)
+    app.config.setdefault('SLOW_QUERY_MS', 100)
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    app.extensions['flaskr.metrics'] = Registry()
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+    app.register_blueprint(bp)
@@ -1,28 +1,179 @@
-from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+import threading
 
-class User(UserMixin):
+from flaskr.cache import LRUCache
+from flaskr.db import get_read_db
+from flaskr.hashing import check_password, hash_password
+
+class User(object):
+    '''
+    Usuario para Flask-Login. No hereda de UserMixin para poder usar
+    __slots__ (con una clase base sin __slots__ cada instancia tendría igual
+    su __dict__), así que implementa aquí los atributos que pide Flask-Login.
+    '''
+
+    __slots__ = ('id', 'name', 'email', 'password', 'is_admin')
+
+    is_active = True
+    is_authenticated = True
+    is_anonymous = False
 
     def __init__(self, id, name, email, password, is_admin=False):
         self.id = id
         self.name = name
         self.email = email
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
         self.is_admin = is_admin
 
+    @classmethod
+    def from_row(cls, row):
+        '''Crea el usuario a partir de una fila de la tabla user (con el hash ya hecho).'''
+        user = cls.__new__(cls)
+        user.id = row['id']
+        user.name = row['username']
+        user.email = row['email']
+        user.password = row['password']
+        user.is_admin = False
+        return user
+
+    def get_id(self):
+        return str(self.id)
+
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        return check_password(self.password, password)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
 
     def __repr__(self):
         return '<User {}'.format(self.email)
 
-users = []
+def _email_key(email):
+    return email.lower() if email else None
+
+class UserRegistry(object):
+    '''
+    Usuarios indexados por id, email y nombre en diccionarios, así que las
+    búsquedas son O(1) tenga los usuarios que tenga (load_user se llama en
+    cada petición). Las lecturas no bloquean; las escrituras van con un lock
+    para que los tres índices se actualicen juntos.
+    '''
+
+    def __init__(self):
+        self._by_id = {}
+        self._by_email = {}
+        self._by_name = {}
+        self._lock = threading.Lock()
+
+    def add(self, user):
+        with self._lock:
+            email = _email_key(user.email)
+            if user.id in self._by_id:
+                raise ValueError(f'ya existe un usuario con id {user.id}')
+            if email is not None and email in self._by_email:
+                raise ValueError(f'ya existe un usuario con email {user.email}')
+            if user.name in self._by_name:
+                raise ValueError(f'ya existe un usuario con nombre {user.name}')
+            self._by_id[user.id] = user
+            if email is not None:
+                self._by_email[email] = user
+            self._by_name[user.name] = user
+        return user
+
+    def remove(self, user_id):
+        with self._lock:
+            user = self._by_id.pop(user_id, None)
+            if user is not None:
+                self._by_email.pop(_email_key(user.email), None)
+                self._by_name.pop(user.name, None)
+        return user
+
+    def invalidate(self, user_id):
+        '''
+        Aquí no hay nada que invalidar: el registro es donde están los
+        usuarios, no una copia de la tabla user.
+        '''
+
+    def get(self, user_id):
+        return self._by_id.get(user_id)
+
+    def get_by_email(self, email):
+        return self._by_email.get(_email_key(email))
+
+    def get_by_username(self, username):
+        return self._by_name.get(username)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def __contains__(self, user_id):
+        return user_id in self._by_id
+
+class SqliteUserRegistry(object):
+    '''
+    Registro que lee de la tabla user los usuarios que no tiene en memoria
+    (con una consulta por índice) y se queda como mucho `maxsize` en una
+    LRUCache. Los índices por email y nombre solo guardan la id; si el
+    usuario de esa id ya no está o ha cambiado, se vuelve a leer. Si cambia
+    la fila de un usuario hay que llamar a invalidate() para que se vuelva
+    a leer.
+    '''
+
+    def __init__(self, maxsize=1024):
+        self._by_id = LRUCache(maxsize)
+        self._by_email = LRUCache(maxsize)
+        self._by_name = LRUCache(maxsize)
+
+    def get(self, user_id):
+        user = self._by_id.get(user_id)
+        if user is None:
+            user = self._load('id', user_id)
+        return user
+
+    def get_by_email(self, email):
+        key = _email_key(email)
+        user = self._by_id.get(self._by_email.get(key))
+        if (user is None or _email_key(user.email) != key) and email:
+            user = self._load('email', email)
+        return user
+
+    def get_by_username(self, username):
+        user = self._by_id.get(self._by_name.get(username))
+        if user is None or user.name != username:
+            user = self._load('username', username)
+        return user
+
+    def invalidate(self, user_id):
+        self._by_id.delete(user_id)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def _load(self, column, value):
+        row = get_read_db().execute(
+            f'SELECT id, username, email, password FROM user WHERE {column} = ?',
+            (value,)
+        ).fetchone()
+        if row is None:
+            return None
+        user = User.from_row(row)
+        self._by_id.set(user.id, user)
+        if user.email:
+            self._by_email.set(_email_key(user.email), user.id)
+        self._by_name.set(user.name, user.id)
+        return user
+
+users = UserRegistry()
 
 def get_user(email):
-    for user in users:
-        if user.email == email:
-            return user
-        return None
\ No newline at end of file
+    return users.get_by_email(email)
@@ -0,0 +1,279 @@
+'''
+Límite de intentos de login y registro.
+Cada intento cuesta un hash scrypt, así que una ráfaga de intentos (por
+ejemplo, probar listas de contraseñas robadas) puede dejar sin CPU a todos
+los workers. El decorador rate_limited cuenta los POST de la vista por IP y
+por cuenta (el email o nombre que se envía) y, si alguno pasa del límite,
+contesta 429 con Retry-After antes de validar el formulario o hacer ningún
+hash.
+
+Se usa una ventana deslizante aproximada: por cada clave se guardan los
+intentos de la ventana actual y de la anterior, y la anterior cuenta en
+proporción a lo que queda de ella. Es O(1) por comprobación y ocupa tres
+números por clave.
+
+Configuración:
+- RATELIMIT_ENABLED: False lo desactiva
+- RATELIMIT_WINDOW: segundos de la ventana
+- RATELIMIT_PER_IP / RATELIMIT_PER_ACCOUNT: intentos por ventana
+- RATELIMIT_BACKEND: 'memory' (por proceso, como mucho RATELIMIT_MAX_KEYS
+claves) o 'sqlite' (fichero RATELIMIT_PATH compartido por todos los
+procesos de la máquina)
+
+La IP es request.remote_addr; detrás de un proxy hay que envolver la app con
+werkzeug.middleware.proxy_fix.ProxyFix para que sea la del cliente.
+'''
+import functools
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+
+class RateLimited(TooManyRequests):
+    description = 'Demasiados intentos, vuelve a probar más tarde.'
+
+def _slide(entry, window_id):
+    '''(ventana, actual, anterior) movida a la ventana window_id.'''
+    if entry is None:
+        return window_id, 0, 0
+    entry_window, current, previous = entry
+    if entry_window == window_id:
+        return entry
+    if entry_window == window_id - 1:
+        return window_id, 0, current
+    return window_id, 0, 0
+
+def _check(entry, limit, window, now):
+    '''
+    Devuelve (entrada nueva, segundos de espera). Si la espera es 0 el
+    intento cuenta y entra en la entrada nueva; si no, no se cuenta.
+    '''
+    window_id = int(now // window)
+    window_id, current, previous = _slide(entry, window_id)
+    elapsed = now / window - window_id
+    if previous * (1 - elapsed) + current + 1 <= limit:
+        return (window_id, current + 1, previous), 0
+
+    # cuándo baja lo bastante la parte de la ventana anterior...
+    if current < limit and previous:
+        needed = 1 - (limit - 1 - current) / previous
+        wait = (needed - elapsed) * window
+    # ...o, si con la actual ya no cabe, cuándo baja la actual al pasar a ser
+    # la anterior
+    else:
+        needed = 1 - (limit - 1) / current if current else 0
+        wait = (1 - elapsed + max(needed, 0)) * window
+    return (window_id, current, previous), max(1, math.ceil(wait))
+
+class MemoryBackend(object):
+    '''
+    Contadores en un diccionario ordenado por último uso: como mucho
+    max_keys claves, y las que llevan más de una ventana sin usarse se van
+    quitando desde el principio en cada comprobación.
+    '''
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now):
+        with self._lock:
+            entry, wait = _check(self._data.get(key), limit, window, now)
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            self._evict(int(now // window))
+        return wait
+
+    def _evict(self, window_id):
+        while self._data:
+            key, entry = next(iter(self._data.items()))
+            if len(self._data) <= self.max_keys and entry[0] >= window_id - 1:
+                break
+            del self._data[key]
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class SqliteBackend(object):
+    '''
+    Contadores en un fichero sqlite aparte, compartido por todos los
+    procesos de la máquina. Cada hilo usa su propia conexión; las claves
+    caducadas se borran cada 1000 comprobaciones.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.evictions = 0
+        self._local = threading.local()
+        self._checks = 0
+        # los contadores de la instancia se comparten entre hilos
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ratelimit ('
+                ' key TEXT PRIMARY KEY, window INTEGER NOT NULL,'
+                ' current INTEGER NOT NULL, previous INTEGER NOT NULL'
+                ') WITHOUT ROWID'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS ratelimit_window_idx'
+                ' ON ratelimit (window)'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None
+            )
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+        return conn
+
+    def hit(self, key, limit, window, now):
+        conn = self._connect()
+        # IMMEDIATE para que otro proceso no lea el mismo contador a la vez
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            entry = conn.execute(
+                'SELECT window, current, previous FROM ratelimit WHERE key = ?',
+                (key,)
+            ).fetchone()
+            entry, wait = _check(entry, limit, window, now)
+            conn.execute(
+                'INSERT OR REPLACE INTO ratelimit (key, window, current, previous)'
+                ' VALUES (?, ?, ?, ?)',
+                (key, *entry)
+            )
+            with self._lock:
+                self._checks += 1
+                cleanup = self._checks % 1000 == 0
+            if cleanup:
+                deleted = conn.execute(
+                    'DELETE FROM ratelimit WHERE window < ?', (entry[0] - 1,)
+                ).rowcount
+                with self._lock:
+                    self.evictions += deleted
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def clear(self):
+        self._connect().execute('DELETE FROM ratelimit')
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM ratelimit').fetchone()[0]
+
+def account_key(account):
+    '''
+    Clave de tamaño fijo para la cuenta: el valor viene tal cual del
+    formulario y podría ocupar cientos de KB, y RATELIMIT_MAX_KEYS limita
+    cuántas claves hay, no cuánto ocupan.
+    '''
+    normalized = account.strip().lower().encode('utf8')
+    return hashlib.blake2b(normalized, digest_size=16).hexdigest()
+
+class RateLimiter(object):
+
+    def __init__(self, backend, window=60, per_ip=20, per_account=5):
+        self.backend = backend
+        self.window = window
+        self.per_ip = per_ip
+        self.per_account = per_account
+        self.checks = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def hit(self, scope, ip, account=None, now=None):
+        '''
+        Cuenta un intento de `ip` sobre `account` y devuelve los segundos que
+        hay que esperar (0 si se deja pasar). La IP se mira primero, así que
+        un intento rechazado por IP no gasta intentos de la cuenta.
+        '''
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self.checks += 1
+        rules = [(f'{scope}:ip:{ip}', self.per_ip)]
+        if account:
+            rules.append((f'{scope}:account:{account_key(account)}', self.per_account))
+        for key, limit in rules:
+            wait = self.backend.hit(key, limit, self.window, now)
+            if wait:
+                with self._lock:
+                    self.rejected += 1
+                return wait
+        return 0
+
+    def stats(self):
+        return {
+            'checks': self.checks, 'rejected': self.rejected,
+            'evictions': self.backend.evictions, 'size': len(self.backend),
+        }
+
+def get_limiter(app=None):
+    if app is None:
+        app = current_app
+    return app.extensions.get('flaskr.ratelimit')
+
+def rate_limited(scope, account_field=None):
+    '''
+    Decorador para las vistas de login y registro: cada POST cuenta como un
+    intento para la IP y para el valor del campo `account_field`. Los GET no
+    se limitan.
+    '''
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped_view(**kwargs):
+            limiter = get_limiter()
+            if limiter is not None and request.method == 'POST':
+                account = request.form.get(account_field) if account_field else None
+                wait = limiter.hit(scope, request.remote_addr, account)
+                if wait:
+                    raise RateLimited(retry_after=wait)
+            return view(**kwargs)
+
+        return wrapped_view
+
+    return decorator
+
+def make_backend(config):
+    backend = config['RATELIMIT_BACKEND']
+    if backend == 'memory':
+        return MemoryBackend(config['RATELIMIT_MAX_KEYS'])
+    if backend == 'sqlite':
+        return SqliteBackend(config['RATELIMIT_PATH'])
+    raise ValueError(f'RATELIMIT_BACKEND {backend!r} no válido')
+
+def init_app(app):
+    app.config.setdefault('RATELIMIT_ENABLED', True)
+    app.config.setdefault('RATELIMIT_BACKEND', 'memory')
+    app.config.setdefault(
+        'RATELIMIT_PATH', os.path.join(app.instance_path, 'ratelimit.sqlite')
+    )
+    app.config.setdefault('RATELIMIT_MAX_KEYS', 10000)
+    app.config.setdefault('RATELIMIT_WINDOW', 60)
+    app.config.setdefault('RATELIMIT_PER_IP', 20)
+    app.config.setdefault('RATELIMIT_PER_ACCOUNT', 5)
+    if app.config['RATELIMIT_ENABLED']:
+        app.extensions['flaskr.ratelimit'] = RateLimiter(
+            make_backend(app.config),
+            app.config['RATELIMIT_WINDOW'],
+            app.config['RATELIMIT_PER_IP'],
+            app.config['RATELIMIT_PER_ACCOUNT'],
+        )
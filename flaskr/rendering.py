@@ -0,0 +1,146 @@
+'''
+Conversión de los cuerpos de los posts de Markdown a HTML.
+Se hace una sola vez al escribir el post (create, update, import-posts) y
+el resultado se guarda en post.body_html junto con un extracto en texto
+plano (post.excerpt) para las listas; las plantillas solo tienen que
+imprimir esas columnas.
+
+Es un subconjunto de Markdown: títulos (#), párrafos, listas (- o 1.),
+citas (>), bloques de código (```), `código`, **negrita**, *cursiva* y
+[enlaces](https://...). El texto se escapa antes de aplicar el formato, así
+que el HTML que escriba el usuario nunca llega a la página tal cual.
+
+Si cambia el resultado de render_markdown hay que subir RENDERER_VERSION y
+ejecutar `flask render-posts` para volver a generar los posts guardados.
+'''
+import re
+
+from markupsafe import escape
+
+RENDERER_VERSION = 2
+
+EXCERPT_LENGTH = 200
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.*?)\s*#*$')
+_UNORDERED = re.compile(r'^[-*+]\s+(.*)$')
+_ORDERED = re.compile(r'^\d+[.)]\s+(.*)$')
+_QUOTE = re.compile(r'^>\s?(.*)$')
+
+_CODE_SPAN = re.compile(r'`([^`]+)`')
+_STRONG = re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*')
+_EM = re.compile(r'(?<![*\w])\*(?=\S)(.+?)(?<=\S)\*(?![*\w])')
+# el texto ya está escapado, por eso las comillas no pueden aparecer en la URL;
+# las rutas relativas no pueden empezar por // ni /\, que irían a otro host
+_LINK = re.compile(r'\[([^\]]+)\]\(((?:https?://|/(?![/\\]))[^\s)]*)\)')
+
+def render_inline(text):
+    '''Formato dentro de una línea; text todavía no está escapado.'''
+    codes = []
+    # \x00 marca los códigos guardados, así que no puede venir en el texto
+    text = text.replace('\x00', '')
+
+    def keep_code(match):
+        codes.append(f'<code>{match.group(1)}</code>')
+        return f'\x00{len(codes) - 1}\x00'
+
+    html = _CODE_SPAN.sub(keep_code, str(escape(text)))
+    html = _LINK.sub(r'<a href="\2" rel="nofollow">\1</a>', html)
+    html = _STRONG.sub(r'<strong>\1</strong>', html)
+    html = _EM.sub(r'<em>\1</em>', html)
+    return re.sub('\x00(\\d+)\x00', lambda m: codes[int(m.group(1))], html)
+
+def _blocks(lines):
+    '''Agrupa las líneas en bloques (tipo, líneas).'''
+    block_type, block = None, []
+    fence = False
+    for line in lines:
+        if fence:
+            if line.strip().startswith('```'):
+                yield 'code', block
+                block_type, block, fence = None, [], False
+            else:
+                block.append(line)
+            continue
+        if line.strip().startswith('```'):
+            if block:
+                yield block_type, block
+            block_type, block, fence = 'code', [], True
+            continue
+        if not line.strip():
+            if block:
+                yield block_type, block
+            block_type, block = None, []
+            continue
+
+        if _HEADING.match(line):
+            line_type = 'heading'
+        elif _UNORDERED.match(line):
+            line_type = 'ul'
+        elif _ORDERED.match(line):
+            line_type = 'ol'
+        elif _QUOTE.match(line):
+            line_type = 'quote'
+        else:
+            line_type = 'p'
+
+        # las líneas sin marca siguen el elemento de lista o la cita anterior
+        continues = block and (
+            line_type == block_type
+            or (line_type == 'p' and block_type in ('ul', 'ol', 'quote'))
+        )
+        if not continues or line_type == 'heading':
+            if block:
+                yield block_type, block
+            block_type, block = line_type, []
+        block.append(line)
+        if line_type == 'heading':
+            yield block_type, block
+            block_type, block = None, []
+    if block:
+        yield block_type, block
+
+def render_markdown(text):
+    html = []
+    for block_type, lines in _blocks(text.replace('\r\n', '\n').split('\n')):
+        if block_type == 'code':
+            html.append(f'<pre><code>{escape(chr(10).join(lines))}</code></pre>')
+        elif block_type == 'heading':
+            hashes, content = _HEADING.match(lines[0]).groups()
+            level = len(hashes)
+            html.append(f'<h{level}>{render_inline(content)}</h{level}>')
+        elif block_type in ('ul', 'ol'):
+            pattern = _UNORDERED if block_type == 'ul' else _ORDERED
+            items = []
+            for line in lines:
+                match = pattern.match(line)
+                if match is not None:
+                    items.append(match.group(1))
+                elif items:
+                    # continuación del elemento anterior
+                    items[-1] += ' ' + line.strip()
+            html.append(f'<{block_type}>' + ''.join(
+                f'<li>{render_inline(item)}</li>' for item in items
+            ) + f'</{block_type}>')
+        elif block_type == 'quote':
+            content = '\n'.join(_QUOTE.sub(r'\1', line) for line in lines)
+            html.append(f'<blockquote>{render_markdown(content)}</blockquote>')
+        else:
+            html.append(
+                '<p>' + '<br>\n'.join(render_inline(line) for line in lines) + '</p>'
+            )
+    return '\n'.join(html)
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    '''Texto plano del principio del post, cortado por una palabra.'''
+    plain = re.sub(r'```.*?(```|$)', ' ', text, flags=re.S)
+    plain = _LINK.sub(r'\1', plain)
+    plain = re.sub(r'^\s*(#{1,6}|[-*+>]|\d+[.)])\s+', '', plain, flags=re.M)
+    plain = re.sub(r'[*`]', '', plain)
+    plain = ' '.join(plain.split())
+    if len(plain) <= length:
+        return plain
+    return plain[:length].rsplit(' ', 1)[0] + '…'
+
+def rendered_columns(body):
+    '''Valores de (body_html, excerpt, render_version) para un cuerpo.'''
+    return render_markdown(body), make_excerpt(body), RENDERER_VERSION
@@ -1,11 +1,19 @@
 DROP TABLE IF EXISTS user;
+DROP TABLE IF EXISTS post_fts;
+DROP TABLE IF EXISTS post_archive;
 DROP TABLE IF EXISTS post;
--- DROP TABLE IF EXISTS enlaces;
+DROP TABLE IF EXISTS content_version;
+DROP TABLE IF EXISTS enlace_metadata;
+DROP TABLE IF EXISTS enlaces;
 
 CREATE TABLE user (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     username TEXT UNIQUE NOT NULL,
-    password TEXT NOT NULL
+    email TEXT UNIQUE COLLATE NOCASE,
+    password TEXT NOT NULL,
+    -- posts del usuario, mantenido por los triggers post_count_* para que
+    -- las páginas de autor no tengan que hacer COUNT(*) sobre post
+    post_count INTEGER NOT NULL DEFAULT 0
 );
 
 CREATE TABLE post (
@@ -14,13 +22,149 @@ CREATE TABLE post (
     created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     title TEXT NOT NULL,
     body TEXT NOT NULL,
+    -- body convertido de Markdown a HTML y extracto en texto plano, generados
+    -- al escribir (rendering.py); render_version es la versión del conversor
+    -- con la que se generaron (0 = sin generar, flask render-posts los rehace)
+    body_html TEXT NOT NULL DEFAULT '',
+    excerpt TEXT NOT NULL DEFAULT '',
+    render_version INTEGER NOT NULL DEFAULT 0,
+    slug TEXT,
     FOREIGN KEY (author_id) REFERENCES user (id)
 );
 
--- CREATE TABLE enlaces (
---     id INTEGER PRIMARY KEY AUTOINCREMENT,
---     author_id INTEGER NOT NULL,
---     created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
---     url_enlace TEXT NOT NULL,
---     FOREIGN KEY (author_id) REFERENCES user (id)
--- );
\ No newline at end of file
+-- /p/<slug> se resuelve con una sola búsqueda en este índice
+CREATE UNIQUE INDEX post_slug_idx ON post (slug);
+
+-- páginas de autor (/u/<username>): mismo cursor que el index por autor
+CREATE INDEX post_author_created_idx ON post (author_id, created DESC, id DESC);
+
+CREATE TRIGGER post_count_insert AFTER INSERT ON post BEGIN
+    UPDATE user SET post_count = post_count + 1 WHERE id = new.author_id;
+END;
+
+CREATE TRIGGER post_count_delete AFTER DELETE ON post BEGIN
+    UPDATE user SET post_count = post_count - 1 WHERE id = old.author_id;
+END;
+
+CREATE TRIGGER post_count_update AFTER UPDATE OF author_id ON post BEGIN
+    UPDATE user SET post_count = post_count - 1 WHERE id = old.author_id;
+    UPDATE user SET post_count = post_count + 1 WHERE id = new.author_id;
+END;
+
+-- posts por mes ('2024-05') y autor, mantenido por los triggers
+-- post_archive_*: la navegación del archivo lee una fila por mes en lugar
+-- de agrupar toda la tabla post (flask rebuild-archive la rehace entera)
+CREATE TABLE post_archive (
+    month TEXT NOT NULL,
+    author_id INTEGER NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (month, author_id)
+) WITHOUT ROWID;
+
+CREATE TRIGGER post_archive_insert AFTER INSERT ON post BEGIN
+    INSERT INTO post_archive (month, author_id, count)
+    VALUES (strftime('%Y-%m', new.created), new.author_id, 1)
+    ON CONFLICT (month, author_id) DO UPDATE SET count = count + 1;
+END;
+
+CREATE TRIGGER post_archive_delete AFTER DELETE ON post BEGIN
+    UPDATE post_archive SET count = count - 1
+    WHERE month = strftime('%Y-%m', old.created) AND author_id = old.author_id;
+    DELETE FROM post_archive
+    WHERE month = strftime('%Y-%m', old.created) AND author_id = old.author_id
+    AND count <= 0;
+END;
+
+CREATE TRIGGER post_archive_update AFTER UPDATE OF created, author_id ON post BEGIN
+    UPDATE post_archive SET count = count - 1
+    WHERE month = strftime('%Y-%m', old.created) AND author_id = old.author_id;
+    DELETE FROM post_archive
+    WHERE month = strftime('%Y-%m', old.created) AND author_id = old.author_id
+    AND count <= 0;
+    INSERT INTO post_archive (month, author_id, count)
+    VALUES (strftime('%Y-%m', new.created), new.author_id, 1)
+    ON CONFLICT (month, author_id) DO UPDATE SET count = count + 1;
+END;
+
+-- índice para la paginación por cursor (created, id) del index
+CREATE INDEX post_created_id_idx ON post (created DESC, id DESC);
+
+-- índice de texto completo sobre title y body. Es una tabla fts5 de
+-- "contenido externo": no duplica el texto, lo lee de post, y los triggers
+-- la mantienen al día (flask rebuild-search-index la reconstruye entera).
+CREATE VIRTUAL TABLE post_fts USING fts5(
+    title, body,
+    content='post', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN
+    INSERT INTO post_fts (rowid, title, body)
+    VALUES (new.id, new.title, new.body);
+END;
+
+CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN
+    INSERT INTO post_fts (post_fts, rowid, title, body)
+    VALUES ('delete', old.id, old.title, old.body);
+END;
+
+CREATE TRIGGER post_fts_update AFTER UPDATE OF title, body ON post BEGIN
+    INSERT INTO post_fts (post_fts, rowid, title, body)
+    VALUES ('delete', old.id, old.title, old.body);
+    INSERT INTO post_fts (rowid, title, body)
+    VALUES (new.id, new.title, new.body);
+END;
+
+-- versión del contenido: blog.py la sube en cada escritura y se usa como
+-- clave de la caché de fragmentos
+CREATE TABLE content_version (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    modified TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO content_version (name) VALUES ('post');
+
+-- url_enlace es la URL tal como se compartió la primera vez y url_canonica
+-- su forma normalizada (enlaces.canonicalize_url). url_hash son 64 bits del
+-- sha256 de url_canonica, con índice único: buscar duplicados es una sola
+-- consulta por índice de ancho fijo en lugar de comparar textos largos.
+CREATE TABLE enlaces (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    author_id INTEGER NOT NULL,
+    created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    url_enlace TEXT NOT NULL,
+    url_canonica TEXT NOT NULL,
+    url_hash INTEGER NOT NULL,
+    compartido INTEGER NOT NULL DEFAULT 1,
+    -- visitas por /l/<código>, sumadas por lotes desde enlaces.ClickBuffer
+    clicks INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (author_id) REFERENCES user (id)
+);
+
+CREATE UNIQUE INDEX enlaces_url_hash_idx ON enlaces (url_hash);
+CREATE INDEX enlaces_created_id_idx ON enlaces (created DESC, id DESC);
+
+-- metadatos de las páginas enlazadas y cola de flask fetch-metadata
+-- (metadata.py): se descarga cuando next_fetch ha pasado. etag y
+-- last_modified son los de la última respuesta, para pedirla condicional.
+CREATE TABLE enlace_metadata (
+    enlace_id INTEGER PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    title TEXT,
+    description TEXT,
+    favicon TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    fetched TIMESTAMP,
+    next_fetch TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (enlace_id) REFERENCES enlaces (id)
+);
+
+CREATE INDEX enlace_metadata_next_fetch_idx ON enlace_metadata (next_fetch);
+
+CREATE TRIGGER enlace_metadata_insert AFTER INSERT ON enlaces BEGIN
+    INSERT INTO enlace_metadata (enlace_id) VALUES (new.id);
+END;
@@ -0,0 +1,169 @@
+'''
+Arranque rápido de los procesos de la app.
+- las plantillas compiladas se guardan en TEMPLATE_BYTECODE_CACHE (por
+defecto instance/jinja-cache), así que un proceso nuevo no vuelve a
+compilar cada plantilla la primera vez que la usa; `flask compile-templates`
+las deja compiladas al desplegar
+- los módulos que solo se usan desde la consola (bulk, metadata) no se
+importan al crear la app: sus órdenes se registran con LazyCommand y el
+módulo se importa al ejecutar la orden
+- `flask startup-profile` arranca un proceso nuevo con -X importtime y
+cuenta cuánto tarda cada import, create_app y la primera petición
+'''
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+import click
+from flask import current_app
+from flask.cli import ScriptInfo, with_appcontext
+from jinja2 import FileSystemBytecodeCache
+
+# orden -> (módulo:objeto, ayuda corta para `flask --help`)
+LAZY_COMMANDS = {
+    'export-posts': ('flaskr.bulk:export_posts_command', 'Exporta los posts.'),
+    'import-posts': ('flaskr.bulk:import_posts_command', 'Importa posts.'),
+    'export-links': ('flaskr.bulk:export_links_command', 'Exporta los enlaces.'),
+    'import-links': ('flaskr.bulk:import_links_command', 'Importa enlaces.'),
+    'fetch-metadata': (
+        'flaskr.metadata:fetch_metadata_command',
+        'Descarga título, descripción y favicon de los enlaces pendientes.'
+    ),
+}
+
+class LazyCommand(click.Command):
+    '''
+    Orden que importa su módulo solo al ejecutarse. Los argumentos (y
+    --help) se pasan tal cual a la orden de verdad. Si el módulo tiene
+    DEFAULT_CONFIG, se añade a la configuración de la app al cargarlo.
+    '''
+
+    def __init__(self, name, import_name, help=None):
+        super().__init__(
+            name, help=help, short_help=help, add_help_option=False,
+            context_settings={
+                'ignore_unknown_options': True, 'allow_extra_args': True,
+            },
+        )
+        self.import_name = import_name
+
+    def load(self):
+        module_name, attr = self.import_name.split(':')
+        module = importlib.import_module(module_name)
+        for key, value in getattr(module, 'DEFAULT_CONFIG', {}).items():
+            current_app.config.setdefault(key, value)
+        return getattr(module, attr)
+
+    def invoke(self, ctx):
+        if not current_app:
+            app = ctx.ensure_object(ScriptInfo).load_app()
+            ctx.with_resource(app.app_context())
+        command = self.load()
+        # hermano de ctx y no hijo, para que el uso y los errores digan
+        # "flask import-posts" y no "flask import-posts import-posts"
+        with command.make_context(
+            self.name, list(ctx.args), parent=ctx.parent
+        ) as sub_ctx:
+            return command.invoke(sub_ctx)
+
+def _parse_importtime(stderr):
+    '''Filas (propio µs, acumulado µs, módulo) de la salida de -X importtime.'''
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        if own.strip().isdigit():
+            rows.append((int(own), int(cumulative), name.rstrip()))
+    return rows
+
+# se ejecuta en el proceso nuevo; imprime los tiempos en JSON
+_PROFILE_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+from flaskr import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+client = app.test_client()
+status = client.get(sys.argv[1]).status_code
+first = time.perf_counter()
+client.get(sys.argv[1])
+second = time.perf_counter()
+print(json.dumps({
+    'import': imported - start, 'create_app': created - imported,
+    'first_request': first - created, 'second_request': second - first,
+    'status': status,
+}))
+'''
+
+@click.command('startup-profile')
+@click.option('--path', default='/', show_default=True,
+              help='URL de la primera petición.')
+@click.option('--top', type=click.IntRange(min=1), default=15, show_default=True,
+              help='Módulos más lentos que se muestran.')
+def startup_profile_command(path, top):
+    '''Mide los imports, create_app y la primera petición de un proceso nuevo.'''
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [package_root, env.get('PYTHONPATH')])
+    )
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _PROFILE_SCRIPT, path],
+        capture_output=True, text=True, env=env
+    )
+    try:
+        times = json.loads(result.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        raise click.ClickException(
+            'el proceso de prueba ha fallado:\n' + result.stderr[-2000:]
+        )
+
+    rows = _parse_importtime(result.stderr)
+    # los de primer nivel son los que no están indentados
+    top_level = [row for row in rows if not row[2].startswith('  ')]
+    click.echo(f'Imports de primer nivel más lentos (de {len(rows)} módulos):')
+    for own, cumulative, name in sorted(top_level, reverse=True, key=lambda r: r[1])[:top]:
+        click.echo(f'{cumulative / 1000:9.1f} ms  {name.strip()}')
+
+    click.echo('Módulos de flaskr:')
+    for own, cumulative, name in rows:
+        if name.strip().startswith('flaskr'):
+            click.echo(
+                f'{cumulative / 1000:9.1f} ms  {name.strip()}'
+                f' (propio {own / 1000:.1f} ms)'
+            )
+
+    for key in ('import', 'create_app', 'first_request', 'second_request'):
+        click.echo(f'{key}: {times[key] * 1000:.1f} ms')
+    click.echo(f"status de {path}: {times['status']}")
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates_command():
+    '''Compila todas las plantillas y las guarda en TEMPLATE_BYTECODE_CACHE.'''
+    env = current_app.jinja_env
+    if env.bytecode_cache is None:
+        raise click.ClickException('TEMPLATE_BYTECODE_CACHE está desactivado')
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    click.echo(f'Compiladas {len(names)} plantillas')
+
+def init_app(app):
+    # None desactiva la caché de plantillas compiladas
+    app.config.setdefault(
+        'TEMPLATE_BYTECODE_CACHE', os.path.join(app.instance_path, 'jinja-cache')
+    )
+    directory = app.config['TEMPLATE_BYTECODE_CACHE']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    for name, (import_name, help) in LAZY_COMMANDS.items():
+        app.cli.add_command(LazyCommand(name, import_name, help))
+    app.cli.add_command(compile_templates_command)
+    app.cli.add_command(startup_profile_command)
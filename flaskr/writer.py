@@ -0,0 +1,200 @@
+'''
+Escrituras agrupadas ("group commit").
+Con sqlite cada commit es un fsync y los escritores van de uno en uno, así
+que con muchas escrituras a la vez cada petición espera el fsync de todas
+las anteriores (o acaba en "database is locked"). Con WRITE_QUEUE activado
+las escrituras se pasan a un único hilo escritor con su propia conexión,
+que junta las que llegan en WRITE_QUEUE_MAX_DELAY milisegundos (o hasta
+WRITE_QUEUE_MAX_BATCH) en una sola transacción: un fsync para todo el lote.
+
+Cada operación es una función fn(db, *args) que no hace commit. Va dentro de
+su propio SAVEPOINT, así que si falla solo se deshace ella y su excepción le
+llega a quien la pidió; el resto del lote se guarda igual. La petición
+espera al commit del lote antes de recibir el resultado.
+
+Si el resultado no llega en WRITE_QUEUE_TIMEOUT segundos se cancela la
+operación y se contesta 503 (WriteTimeout): la operación no se ha escrito,
+así que se puede reintentar. Si ya había empezado no se puede cancelar y
+puede que ya esté escrita, así que se espera a que acabe su lote en lugar
+de dar un error que invitaría a repetirla (y a duplicar el post o el
+enlace).
+
+Sin WRITE_QUEUE, write() ejecuta la función con get_write_db() y hace commit en
+el mismo hilo, como hasta ahora.
+'''
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+
+from flaskr.db import connect, get_write_db
+
+# marca para que el hilo escritor termine
+_STOP = object()
+
+class WriteTimeout(ServiceUnavailable):
+    description = 'El servidor está muy ocupado, vuelve a probar en unos segundos.'
+
+class WriteQueue(object):
+
+    def __init__(self, config, max_batch=100, max_delay=5):
+        self.config = config
+        self.max_batch = max_batch
+        self.max_delay = max_delay / 1000
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, function, *args):
+        '''Encola fn(db, *args) y devuelve un Future con su resultado.'''
+        future = Future()
+        self._start()
+        self._queue.put((future, function, args))
+        return future
+
+    def run(self, function, *args, timeout=None):
+        '''
+        Espera el resultado. Pasado el timeout, lanza WriteTimeout si la
+        operación todavía estaba en cola (y ya no se ejecutará) o, si ya se
+        está escribiendo, espera a que termine.
+        '''
+        future = self.submit(function, *args)
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            if future.cancel():
+                raise WriteTimeout(retry_after=1)
+            return future.result()
+
+    def shutdown(self):
+        '''Termina el hilo después de escribir lo que ya estaba en cola.'''
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def stats(self):
+        return {
+            'batches': self.batches, 'operations': self.operations,
+            'pending': self._queue.qsize(),
+        }
+
+    def _start(self):
+        # el hilo se arranca con la primera escritura, no al crear la app
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._loop, name='flaskr-writer', daemon=True
+                    )
+                    self._thread.start()
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # lo que quede se escribe en la siguiente vuelta
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        db = connect(self.config)
+        # BEGIN y COMMIT los pone _write, no el módulo sqlite3
+        db.isolation_level = None
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                self._write(db, batch)
+        finally:
+            db.close()
+
+    def _write(self, db, batch):
+        # las operaciones canceladas mientras esperaban no se ejecutan
+        batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        results = []
+        try:
+            db.execute('BEGIN IMMEDIATE')
+            for future, function, args in batch:
+                db.execute('SAVEPOINT op')
+                try:
+                    results.append((True, function(db, *args)))
+                except Exception as e:
+                    db.execute('ROLLBACK TO op')
+                    results.append((False, e))
+                db.execute('RELEASE op')
+            db.execute('COMMIT')
+        except Exception as e:
+            # no se ha guardado nada del lote
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+            for future, function, args in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.operations += len(batch)
+        for (future, function, args), (ok, value) in zip(batch, results):
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+def get_writer(app=None):
+    if app is None:
+        app = current_app
+    return app.extensions.get('flaskr.writer')
+
+def write(function, *args):
+    '''
+    Ejecuta fn(db, *args) y la confirma, por la cola de escritura si está
+    activada. Devuelve lo que devuelva fn; si fn lanza una excepción no se
+    escribe nada de esa operación y la excepción se propaga.
+    '''
+    writer = get_writer()
+    if writer is not None:
+        timeout = current_app.config['WRITE_QUEUE_TIMEOUT']
+        return writer.run(function, *args, timeout=timeout)
+
+    db = get_write_db()
+    try:
+        result = function(db, *args)
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
+    return result
+
+def init_app(app):
+    app.config.setdefault('WRITE_QUEUE', False)
+    app.config.setdefault('WRITE_QUEUE_MAX_BATCH', 100)
+    app.config.setdefault('WRITE_QUEUE_MAX_DELAY', 5)
+    app.config.setdefault('WRITE_QUEUE_TIMEOUT', 30)
+    if app.config['WRITE_QUEUE']:
+        app.extensions['flaskr.writer'] = WriteQueue(
+            app.config,
+            app.config['WRITE_QUEUE_MAX_BATCH'],
+            app.config['WRITE_QUEUE_MAX_DELAY'],
+        )
@@ -1,35 +1,96 @@
 import os
+import sqlite3
 import tempfile
+import uuid
 
 import pytest
 from flaskr import create_app
-from flaskr.db import get_db, init_db
+from flaskr.db import get_db, get_pools, init_db
 
 with open(os.path.join(os.path.dirname(__file__), 'data.sql'), 'rb') as f:
     _data_sql = f.read().decode('utf8')
 
-@pytest.fixture
-def app():
+TEST_CONFIG = {
+    'TESTING': True, # indica a Flask que la app está en modo test
+    'HASH_POOL_WORKERS': 0, # hash en el mismo proceso
+    'CLICK_FLUSH_INTERVAL': 0, # los clics se escriben al llamar a flush
+    'TEMPLATE_BYTECODE_CACHE': None, # no escribe en la carpeta instance
+}
 
-    ''' tempfile mkstemp crea y abre un archivo temporal. En create_app se 
-    sobreescribe la ruta a la base de datos temporalmente para utilizar la db
-    de prueba.
-    '''
-    db_fb, db_path = tempfile.mkstemp()
+def pytest_addoption(parser):
+    parser.addoption(
+        '--db', choices=('memory', 'file'), default='memory',
+        help='bd de cada test: en memoria (por defecto) o en un fichero temporal'
+    )
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'file_db: el test necesita la bd en un fichero (WAL...)'
+    )
 
-    app = create_app({
-        'TESTING': True, # indica a Flask que la app está en modo test
-        'DATABASE': db_path,
-    })
+def _memory_uri():
+    # cache=shared para que todas las conexiones del pool vean la misma bd;
+    # el nombre es único, así que tampoco choca entre workers de pytest-xdist
+    return f'file:flaskr-test-{uuid.uuid4().hex}?mode=memory&cache=shared'
 
+@pytest.fixture(scope='session')
+def template_db():
+    '''
+    schema.sql y data.sql se ejecutan una sola vez por sesión (o por worker
+    con pytest -n) en una bd en memoria; cada test recibe una copia hecha
+    con la API de backup de sqlite, que solo copia páginas.
+    '''
+    uri = _memory_uri()
+    template = sqlite3.connect(uri, uri=True)
+    app = create_app(dict(TEST_CONFIG, DATABASE=uri))
     with app.app_context():
         init_db()
         get_db().executescript(_data_sql)
+    for pool in get_pools(app).values():
+        pool.close_all()
+
+    yield template
+    template.close()
+
+@pytest.fixture
+def app(request, template_db):
+
+    ''' Cada test tiene su bd, copiada de template_db. Por defecto es una bd
+    en memoria que vive mientras `keeper` esté abierta; con --db=file o el
+    marcador file_db se usa un fichero temporal (creado con mkstemp) como
+    en producción.
+    '''
+    file_db = (
+        request.config.getoption('--db') == 'file'
+        or request.node.get_closest_marker('file_db') is not None
+    )
+    if file_db:
+        db_fd, database = tempfile.mkstemp()
+        keeper = sqlite3.connect(database)
+    else:
+        database = _memory_uri()
+        keeper = sqlite3.connect(database, uri=True)
+    template_db.backup(keeper)
+    if file_db:
+        keeper.close()
+
+    app = create_app(dict(TEST_CONFIG, DATABASE=database))
 
     yield app
 
-    os.close(db_fb)
-    os.unlink(db_path)
+    writer = app.extensions.get('flaskr.writer')
+    if writer is not None:
+        writer.shutdown()
+    # los clics pendientes se escriben ahora, con la bd todavía abierta
+    app.extensions['flaskr.clicks'].stop()
+    # cerrando las conexiones del pool sqlite borra los -wal y -shm
+    for pool in get_pools(app).values():
+        pool.close_all()
+    if file_db:
+        os.close(db_fd)
+        os.unlink(database)
+    else:
+        keeper.close()
 
 '''
 Fixture es un pequeño trozo de código (una función, vamos) que nos ayuda a 
@@ -0,0 +1,55 @@
+import json
+
+from flaskr.db import get_db
+
+
+def _add_posts(app, count):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO post (title, body, author_id, created)'
+            ' VALUES (?, ?, 2, ?)',
+            [(f'post {i}', 'cuerpo', f'2019-01-{i:02} 00:00:00')
+             for i in range(1, count + 1)]
+        )
+        db.commit()
+
+def test_posts_page(app, client):
+    _add_posts(app, 3)
+    data = client.get('/api/posts?per_page=2').get_json()
+    assert [post['title'] for post in data['posts']] == ['post 3', 'post 2']
+    assert data['posts'][0]['username'] == 'other'
+    assert data['posts'][0]['created'] == '2019-01-03 00:00:00'
+    assert data['prev'] is None
+
+    data = client.get(f"/api/posts?per_page=2&before={data['next']}").get_json()
+    assert [post['title'] for post in data['posts']] == ['post 1', 'test title']
+    assert data['next'] is None
+
+def test_posts_fields(client):
+    data = client.get('/api/posts?fields=id,title').get_json()
+    assert data['posts'] == [{'id': 1, 'title': 'test title'}]
+
+def test_posts_errors(client):
+    response = client.get('/api/posts?fields=id,password')
+    assert response.status_code == 400
+    assert 'password' in response.get_json()['error']
+    assert client.get('/api/posts?per_page=0').status_code == 400
+    assert client.get('/api/posts?before=x').status_code == 400
+    assert client.get(
+        '/api/posts?before=2019-01-01 00:00:00,99999999999999999999'
+    ).status_code == 400
+
+def test_posts_ndjson(app, client):
+    _add_posts(app, 3)
+    response = client.get('/api/posts.ndjson?fields=id,body')
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'id': 1, 'body': 'test\nbody'},
+        {'id': 2, 'body': 'cuerpo'},
+        {'id': 3, 'body': 'cuerpo'},
+        {'id': 4, 'body': 'cuerpo'},
+    ]
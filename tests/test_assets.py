@@ -0,0 +1,72 @@
+import gzip
+import json
+
+import pytest
+from flask import url_for
+
+from flaskr.assets import fingerprint
+
+@pytest.fixture
+def built(app, runner, tmp_path):
+    app.extensions['flaskr.assets'].build_dir = str(tmp_path)
+    result = runner.invoke(args=['build-static'])
+    assert 'Generados 1 ficheros' in result.output
+    return tmp_path
+
+def test_fingerprint():
+    assert fingerprint('css/a.css', b'x') == 'css/a.2d711642b726.css'
+
+def test_build_static(app, built):
+    with open(app.static_folder + '/style.css', 'rb') as f:
+        css = f.read()
+    hashed = fingerprint('style.css', css)
+    assert json.loads((built / 'manifest.json').read_text()) == {'style.css': hashed}
+    assert (built / hashed).read_bytes() == css
+    assert gzip.decompress((built / (hashed + '.gz')).read_bytes()) == css
+
+    with app.test_request_context():
+        assert url_for('static', filename='style.css') == f'/static/{hashed}'
+        # los ficheros que no están en el manifiesto no cambian
+        assert url_for('static', filename='otro.js') == '/static/otro.js'
+
+def test_fingerprinted_static(app, client, built):
+    with app.test_request_context():
+        url = url_for('static', filename='style.css')
+    assert url.encode() in client.get('/').data
+
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.content_encoding == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert 'max-age=31536000' in response.headers['Cache-Control']
+    assert 'Accept-Encoding' in response.headers['Vary']
+    css = gzip.decompress(response.data)
+
+    response = client.get(url)
+    assert response.content_encoding is None
+    assert response.data == css
+    response.close()
+
+    # el nombre original sigue funcionando, sin caché larga
+    response = client.get('/static/style.css')
+    assert response.data == css
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+    response.close()
+
+def test_compress_response(app, client):
+    app.config['COMPRESS_MIN_SIZE'] = 100
+    plain = client.get('/').data
+
+    response = client.get('/', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.content_encoding == 'gzip'
+    assert gzip.decompress(response.data) == plain
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert int(response.headers['Content-Length']) == len(response.data)
+
+    # por debajo del umbral, streaming o sin Accept-Encoding no se comprime
+    headers = {'Accept-Encoding': 'gzip'}
+    assert client.get('/hello', headers=headers).content_encoding is None
+    assert client.get('/api/posts.ndjson', headers=headers).content_encoding is None
+    app.config['COMPRESS_MIN_SIZE'] = None
+    assert client.get('/', headers=headers).content_encoding is None
@@ -65,4 +65,76 @@ def test_logout(client, auth):
 
     with client:
         auth.logout()
-        assert 'user_id' not in session
\ No newline at end of file
+        assert 'user_id' not in session
+
+# la fila del usuario se guarda en caché y solo se consulta la primera vez
+def test_user_cache(client, app):
+    from flaskr.cache import get_cache
+    from flaskr.auth import invalidate_user
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    cache = get_cache('users', app)
+    with client:
+        client.get('/')
+        assert g.user['username'] == 'test'
+    assert cache.stats()['misses'] == 1
+
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE user SET username = 'renamed' WHERE id = 1")
+        db.commit()
+
+    with client:
+        client.get('/')
+        assert g.user['username'] == 'test' # todavía la fila de la caché
+    assert cache.stats()['hits'] == 1
+
+    with app.app_context():
+        invalidate_user(1)
+    with client:
+        client.get('/')
+        assert g.user['username'] == 'renamed'
+
+def test_user_cache_skips_static(client, app):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    with client:
+        client.get('/static/style.css')
+        assert g.user is None
+
+# al loguearse con un hash antiguo (pbkdf2 en data.sql) se rehace con el
+# método configurado
+def test_login_rehashes_password(app, client):
+    app.config['WTF_CSRF_ENABLED'] = False
+    response = client.post(
+        '/auth/login', data={'email': 'test', 'password': 'test'}
+    )
+    assert response.headers['Location'] == '/'
+
+    with app.app_context():
+        pwhash = get_db().execute(
+            'SELECT password FROM user WHERE id = 1'
+        ).fetchone()[0]
+        assert pwhash.startswith('scrypt:')
+
+    with client:
+        client.get('/')
+        assert session['user_id'] == 1
+
+def test_login_busy(app, client, monkeypatch):
+    from flaskr.hashing import HashingBusy, get_hasher
+
+    def busy(*args):
+        raise HashingBusy(retry_after=1)
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        monkeypatch.setattr(get_hasher(), 'verify', busy)
+    response = client.post(
+        '/auth/login', data={'email': 'test', 'password': 'test'}
+    )
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
@@ -1,5 +1,9 @@
 import pytest
+from flaskr.blog import slugify, unique_slug
+from flaskr.cache import get_cache
 from flaskr.db import get_db
+from flaskr.models import User, UserRegistry
+from flaskr.rendering import RENDERER_VERSION
 
 
 def test_index(client, auth):
@@ -64,6 +68,23 @@ def test_create(client, auth, app):
         count = db.execute('SELECT COUNT(id) FROM post').fetchone()[0]
         assert count == 2
 
+# crear un post invalida la caché del autor, pero no lo saca del registro
+def test_create_keeps_registered_user(client, app):
+    app.config['WTF_CSRF_ENABLED'] = False
+    registry = app.extensions['flaskr.users'] = UserRegistry()
+    registry.add(User(1, 'test', None, 'test'))
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+    client.post('/create', data={'title': 'registro', 'content': ''})
+    assert registry.get(1) is not None
+
+def test_create_nul_body(client, app):
+    app.config['WTF_CSRF_ENABLED'] = False
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+    response = client.post('/create', data={'title': 'nul', 'content': 'x \x001\x00 y'})
+    assert response.status_code == 302
+
 def test_update(client, auth, app):
     auth.login()
     assert client.get('/1/update').status_code == 200
@@ -93,4 +114,372 @@ def test_delete(client, auth, app):
     with app.app_context():
         db = get_db()
         post = db.execute('SELECT * FROM post WHERE id = 1').fetchone()
-        assert post is None
\ No newline at end of file
+        assert post is None
+
+# la paginación por cursor: el index muestra POSTS_PER_PAGE posts y enlaza
+# a la página siguiente con ?before=<created,id>
+def test_index_pagination(app, client):
+    app.config['POSTS_PER_PAGE'] = 2
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO post (title, body, author_id, created)'
+            ' VALUES (?, ?, 1, ?)',
+            [(f'post {i}', '', f'2019-01-0{i} 00:00:00') for i in range(1, 5)]
+        )
+        db.commit()
+
+    response = client.get('/')
+    assert b'post 4' in response.data
+    assert b'post 3' in response.data
+    assert b'post 2' not in response.data
+    assert b'before=2019-01-03' in response.data
+    assert b'after=' not in response.data
+
+    response = client.get('/?before=2019-01-03 00:00:00,4')
+    assert b'post 2' in response.data
+    assert b'post 1' in response.data
+    assert b'post 3' not in response.data
+    assert b'after=2019-01-02' in response.data
+
+    response = client.get('/?after=2019-01-02 00:00:00,3')
+    assert b'post 4' in response.data
+    assert b'post 3' in response.data
+    assert b'post 2' not in response.data
+    assert b'after=' not in response.data
+
+def test_index_bad_cursor(client):
+    assert client.get('/?before=nope').status_code == 400
+    # ids que no caben en un INTEGER de sqlite
+    for id in ('99999999999999999999', str(2 ** 63), '0', '-1'):
+        assert client.get(f'/?before=2019-01-01 00:00:00,{id}').status_code == 400
+    assert client.get(f'/?before=2019-01-01 00:00:00,{2 ** 63 - 1}').status_code == 200
+
+# la segunda visita al index sale de la caché de fragmentos y una escritura
+# sube la versión del contenido, así que el post nuevo aparece enseguida
+def test_index_fragment_cache(app, client):
+    app.config['WTF_CSRF_ENABLED'] = False
+    fragments = app.extensions['flaskr.fragments']
+
+    client.get('/')
+    client.get('/')
+    # la lista de posts y el archivo por meses
+    assert fragments.hits == 2
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    response = client.post('/create', data={'title': 'cached', 'content': 'x'})
+    assert response.headers['Location'] == '/'
+    assert b'cached' in client.get('/').data
+
+    with app.app_context():
+        version = get_db().execute(
+            "SELECT version FROM content_version WHERE name = 'post'"
+        ).fetchone()[0]
+        assert version == 1
+
+# una visita repetida con el ETag recibido devuelve 304 hasta que cambia
+# el contenido
+def test_index_conditional_get(app, client):
+    response = client.get('/')
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    assert etag.startswith('W/')
+    assert 'Cookie' in response.headers['Vary']
+
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    response = client.get('/', headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE post SET title = 'nuevo' WHERE id = 1")
+        db.execute(
+            "UPDATE content_version SET version = version + 1 WHERE name = 'post'"
+        )
+        db.commit()
+
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert b'nuevo' in response.data
+
+# el ETag depende del usuario: al loguearse no se reaprovecha el anónimo
+def test_conditional_get_per_user(client):
+    etag = client.get('/').headers['ETag']
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'private' in response.headers['Cache-Control']
+
+    etag = client.get('/1/update').headers['ETag']
+    response = client.get('/1/update', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+def test_search(app, client):
+    with app.app_context():
+        db = get_db()
+        db.execute(
+            "INSERT INTO post (title, body, author_id) VALUES"
+            " ('Receta de ensaïmada', 'harina y <b>azúcar</b>', 2)"
+        )
+        db.commit()
+
+    response = client.get('/search?q=azucar')
+    assert response.status_code == 200
+    assert b'Receta de ensa' in response.data
+    assert '<mark>azúcar</mark>'.encode() in response.data
+    assert b'&lt;b&gt;' in response.data # el cuerpo se escapa
+    assert b'test title' not in response.data
+
+    # prefijo de la última palabra y caracteres especiales de fts5
+    assert b'test <mark>title</mark>' in client.get('/search?q=tit').data
+    assert client.get('/search?q="AND (').status_code == 200
+    assert client.get('/search?q=test&page=0').status_code == 400
+    assert client.get('/search?q=test&page=99999999999999999999').status_code == 400
+
+# los triggers mantienen el índice al actualizar y borrar
+def test_search_index_triggers(app, client):
+    with app.app_context():
+        db = get_db()
+        db.execute("UPDATE post SET title = 'otro' WHERE id = 1")
+        db.commit()
+    assert b'otro' in client.get('/search?q=otro').data
+    assert b'<mark>' not in client.get('/search?q=title').data
+
+    with app.app_context():
+        db = get_db()
+        db.execute('DELETE FROM post WHERE id = 1')
+        db.commit()
+    assert b'<mark>' not in client.get('/search?q=otro').data
+
+# el HTML del cuerpo se genera al escribir el post y la página solo lo imprime
+def test_create_renders_markdown(app, client):
+    app.config['WTF_CSRF_ENABLED'] = False
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    client.post('/create', data={'title': 'md', 'content': '**hola** <i>x</i>'})
+
+    with app.app_context():
+        post = get_db().execute(
+            "SELECT body_html, excerpt, render_version FROM post WHERE title = 'md'"
+        ).fetchone()
+        assert post['body_html'] == '<p><strong>hola</strong> &lt;i&gt;x&lt;/i&gt;</p>'
+        assert post['excerpt'] == 'hola <i>x</i>'
+        assert post['render_version'] == RENDERER_VERSION
+    assert b'<strong>hola</strong>' in client.get('/').data
+
+def test_render_posts_command(app, runner):
+    result = runner.invoke(args=['render-posts', '--batch-size', '1'])
+    assert 'Regenerados 1 posts' in result.output
+    with app.app_context():
+        db = get_db()
+        post = db.execute('SELECT * FROM post WHERE id = 1').fetchone()
+        assert post['body_html'] == '<p>test<br>\nbody</p>'
+        assert post['render_version'] == RENDERER_VERSION
+        assert db.execute(
+            "SELECT version FROM content_version WHERE name = 'post'"
+        ).fetchone()[0] == 1
+
+    # ya están todos al día
+    assert 'Regenerados 0 posts' in runner.invoke(args=['render-posts']).output
+    assert 'Regenerados 1 posts' in runner.invoke(args=['render-posts', '--all']).output
+
+@pytest.mark.parametrize(('text', 'slug'), (
+    ('Hola, Mundo', 'hola-mundo'),
+    ('¿Qué tal, Mónica?', 'que-tal-monica'),
+    ('  --a__b--  ', 'a-b'),
+    ('日本', ''),
+    ('x' * 100, 'x' * 80),
+))
+def test_slugify(text, slug):
+    assert slugify(text) == slug
+
+def test_unique_slug(app):
+    with app.app_context():
+        db = get_db()
+        assert unique_slug(db, 'hola') == 'hola'
+        db.executemany(
+            "INSERT INTO post (title, body, author_id, slug) VALUES ('t', '', 1, ?)",
+            [('hola',), ('hola-2',), ('hola-mundo',), ('hola-4',)]
+        )
+        assert unique_slug(db, 'hola') == 'hola-3'
+        assert unique_slug(db, 'hola-mundo') == 'hola-mundo-2'
+
+# los títulos sin letras ASCII usan la id, no post, post-2, post-3...
+def test_fallback_slug(app, client):
+    app.config['WTF_CSRF_ENABLED'] = False
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    client.post('/create', data={'title': '日本', 'content': ''})
+    client.post('/create', data={'title': 'x', 'title_slug': '¿?', 'content': ''})
+    with app.app_context():
+        slugs = [row[0] for row in get_db().execute(
+            'SELECT slug FROM post WHERE id > 1 ORDER BY id'
+        )]
+    assert slugs == ['post-2', 'post-3']
+
+def test_fill_slugs(app, runner):
+    assert 'Añadido el slug a 1 posts' in runner.invoke(args=['fill-slugs']).output
+    with app.app_context():
+        assert get_db().execute(
+            'SELECT slug FROM post WHERE id = 1'
+        ).fetchone()[0] == 'test-title'
+    assert 'Añadido el slug a 0 posts' in runner.invoke(args=['fill-slugs']).output
+
+def test_permalink(app, client):
+    app.config['WTF_CSRF_ENABLED'] = False
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    client.post('/create', data={'title': 'Día uno', 'content': 'a'})
+    client.post('/create', data={'title': 'Día uno', 'content': 'b'})
+    client.post('/create', data={'title': 'x', 'title_slug': 'Mi slug', 'content': 'c'})
+
+    with app.app_context():
+        slugs = [row[0] for row in get_db().execute(
+            'SELECT slug FROM post WHERE slug IS NOT NULL ORDER BY id'
+        )]
+    assert slugs == ['dia-uno', 'dia-uno-2', 'mi-slug']
+    assert b'href="/p/dia-uno-2"' in client.get('/').data
+
+    cache = get_cache('slugs', app)
+    response = client.get('/p/dia-uno-2')
+    assert response.status_code == 200
+    assert b'<p>b</p>' in response.data
+    assert cache.get('dia-uno-2') == 3
+    assert client.get('/p/dia-uno-2').status_code == 200
+    assert client.get('/p/nope').status_code == 404
+
+    client.post('/3/delete')
+    assert cache.get('dia-uno-2') is None
+    assert client.get('/p/dia-uno-2').status_code == 404
+
+# post_count lo mantienen los triggers al insertar y borrar
+def test_post_count_triggers(app):
+    with app.app_context():
+        db = get_db()
+        count = lambda id: db.execute(
+            'SELECT post_count FROM user WHERE id = ?', (id,)
+        ).fetchone()[0]
+        assert count(1) == 1
+        db.execute("INSERT INTO post (title, body, author_id) VALUES ('a', '', 2)")
+        assert count(2) == 1
+        db.execute('UPDATE post SET author_id = 2 WHERE id = 1')
+        assert (count(1), count(2)) == (0, 2)
+        db.execute('DELETE FROM post')
+        assert count(2) == 0
+
+def test_author_page(app, client):
+    app.config['POSTS_PER_PAGE'] = 2
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO post (title, body, excerpt, author_id, created)'
+            " VALUES (?, '', ?, 2, ?)",
+            [(f'otro {i}', f'extracto {i}', f'2019-01-0{i} 00:00:00') for i in range(1, 4)]
+        )
+        db.commit()
+        plan = ' '.join(row[3] for row in db.execute(
+            'EXPLAIN QUERY PLAN SELECT id FROM post p WHERE p.author_id = 2'
+            ' ORDER BY p.created DESC, p.id DESC LIMIT 3'
+        ))
+        assert 'post_author_created_idx' in plan
+        assert 'TEMP B-TREE' not in plan
+
+    response = client.get('/u/other')
+    assert response.status_code == 200
+    assert b'3 posts' in response.data
+    assert b'extracto 3' in response.data and b'extracto 2' in response.data
+    assert b'extracto 1' not in response.data
+    assert b'test title' not in response.data
+
+    response = client.get('/u/other?before=2019-01-02 00:00:00,3')
+    assert b'extracto 1' in response.data
+    assert client.get('/u/nope').status_code == 404
+
+# al crear un post cambia post_count, así que el usuario no puede salir de
+# la caché con el valor anterior
+def test_create_invalidates_user(app, client):
+    app.config['WTF_CSRF_ENABLED'] = False
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    client.get('/')
+    assert get_cache('users', app).get(1)['post_count'] == 1
+    client.post('/create', data={'title': 'nuevo', 'content': ''})
+    assert get_cache('users', app).get(1) is None
+    assert b'2 posts' in client.get('/u/test').data
+
+def _archive(db):
+    return [tuple(row) for row in db.execute(
+        'SELECT month, author_id, count FROM post_archive ORDER BY month, author_id'
+    )]
+
+# los triggers mantienen post_archive al insertar, mover y borrar posts
+def test_post_archive_triggers(app):
+    with app.app_context():
+        db = get_db()
+        assert _archive(db) == [('2018-01', 1, 1)]
+        db.executemany(
+            "INSERT INTO post (title, body, author_id, created) VALUES ('a', '', ?, ?)",
+            [(1, '2018-01-20 10:00:00'), (2, '2018-02-01 00:00:00')]
+        )
+        assert _archive(db) == [('2018-01', 1, 2), ('2018-02', 2, 1)]
+        db.execute("UPDATE post SET created = '2018-02-03 00:00:00' WHERE id = 1")
+        assert _archive(db) == [('2018-01', 1, 1), ('2018-02', 1, 1), ('2018-02', 2, 1)]
+        db.execute('DELETE FROM post WHERE author_id = 1')
+        assert _archive(db) == [('2018-02', 2, 1)]
+
+def test_archive(app, client):
+    app.config['POSTS_PER_PAGE'] = 1
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO post (title, slug, body, author_id, created) VALUES (?, ?, '', 2, ?)",
+            [
+                ('enero', 'enero', '2018-01-31 23:59:59'),
+                ('febrero', 'febrero', '2018-02-01 00:00:00'),
+            ]
+        )
+        db.commit()
+
+    response = client.get('/archive/2018/01')
+    assert response.status_code == 200
+    assert b'enero' in response.data
+    assert b'febrero' not in response.data.split(b'<aside')[0]
+    assert b'href="/archive/2018/02"' in response.data
+    assert b'2018-01 (2)' in response.data
+    assert b'/archive/2018/01?before=' in response.data
+
+    response = client.get('/archive/2018/01?before=2018-01-31 23:59:59,2')
+    assert b'test title' in response.data
+    assert b'test title' not in client.get('/archive/2018/02').data
+    assert client.get('/archive/2018/13').status_code == 404
+    assert client.get('/archive/2018/1').status_code == 404
+
+    # el archivo sale también en el index, en los autores y en cada post
+    for path in ('/', '/u/test', '/p/enero'):
+        assert b'href="/archive/2018/02"' in client.get(path).data
+
+def test_rebuild_archive_command(app, runner):
+    with app.app_context():
+        db = get_db()
+        db.execute('DELETE FROM post_archive')
+        db.commit()
+    result = runner.invoke(args=['rebuild-archive'])
+    assert 'Reconstruido el archivo (1 filas)' in result.output
+    with app.app_context():
+        assert _archive(get_db()) == [('2018-01', 1, 1)]
+
+def test_rebuild_search_index_command(app, runner):
+    with app.app_context():
+        get_db().execute("DELETE FROM post_fts")
+        get_db().commit()
+    result = runner.invoke(args=['rebuild-search-index'])
+    assert 'Reconstruido' in result.output
+    with app.app_context():
+        assert get_db().execute(
+            "SELECT rowid FROM post_fts WHERE post_fts MATCH 'test'"
+        ).fetchone()[0] == 1
@@ -0,0 +1,44 @@
+import time
+
+from flaskr.cache import (
+    FragmentCache, LRUCache, MemoryFragmentBackend, SqliteFragmentBackend
+)
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3) # saca 'b', el menos usado
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'evictions': 1, 'size': 2}
+
+def test_lru_cache_ttl(monkeypatch):
+    cache = LRUCache(ttl=10)
+    cache.set('a', 1)
+    now = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: now + 11)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+def test_memory_fragment_backend():
+    backend = MemoryFragmentBackend(max_size=10)
+    backend.set('a', '12345')
+    backend.set('b', '12345')
+    backend.set('c', '123')
+    assert backend.get('a') is None
+    assert backend.get('b') == '12345'
+    assert backend.size == 8
+    backend.set('big', 'x' * 11)
+    assert backend.get('big') is None
+
+def test_sqlite_fragment_backend(tmp_path):
+    path = str(tmp_path / 'fragments.sqlite')
+    cache = FragmentCache(SqliteFragmentBackend(path, max_entries=10))
+    assert cache.get_or_render('k', lambda: '<p>hola</p>') == '<p>hola</p>'
+    # otro proceso (otra instancia) ve el mismo fragmento
+    other = FragmentCache(SqliteFragmentBackend(path, max_entries=10))
+    assert other.get_or_render('k', lambda: 'nuevo') == '<p>hola</p>'
+    assert other.stats() == {'hits': 1, 'misses': 0, 'size': 1}
@@ -1,7 +1,9 @@
 import sqlite3
 
+import threading
+
 import pytest
-from flaskr.db import get_db
+from flaskr.db import get_db, get_pool, get_read_db, get_write_db
 
 '''
 monkeypatch es una fixture de pytest que permite modificar, establecer, 
@@ -12,6 +14,8 @@ se deshacen una vez transcurrida la función o fixture que hace la petición.
 '''
 
 def test_get_close_db(app):
+    app.config['DB_POOL_SIZE'] = 0 # sin pool la conexión se cierra
+
     with app.app_context():
         db = get_db()
         assert db is get_db()
@@ -34,5 +38,111 @@ def test_init_db_command(runner, monkeypatch):
     assert 'Inicializada la base de datos' in result.output
     assert Recorder.called
 
+# con el pool, el mismo hilo recupera su conexión en el siguiente contexto
+def test_pool_reuses_connection(app):
+    with app.app_context():
+        db = get_db()
+    opened = get_pool(app).stats()['opened']
+
+    with app.app_context():
+        assert get_db() is db
+        assert get_db().execute('SELECT 1').fetchone()[0] == 1
+
+    stats = get_pool(app).stats()
+    assert stats['opened'] == opened
+    assert stats['reused'] >= 1
+    assert stats['idle'] == 1 and stats['in_use'] == 0
+
+@pytest.mark.file_db
+def test_pool_pragmas(app):
+    with app.app_context():
+        db = get_db()
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert db.execute('PRAGMA synchronous').fetchone()[0] == 1 # NORMAL
+        assert db.execute('PRAGMA busy_timeout').fetchone()[0] == 5000
+
+# si el pool está lleno, la conexión de otro hilo se cierra al devolverla
+def test_pool_overflow(app):
+    app.config['DB_POOL_SIZE'] = 1
+    with app.app_context():
+        get_db()
 
+    def other_thread():
+        with app.app_context():
+            get_db().execute('SELECT 1')
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+
+    stats = get_pool(app).stats()
+    assert stats['overflow'] == 1
+    assert stats['idle'] == 1
+
+# una transacción abierta no se hereda en la siguiente petición
+def test_pool_rolls_back_on_release(app):
+    with app.app_context():
+        get_db().execute("UPDATE post SET title = 'x' WHERE id = 1")
 
+    with app.app_context():
+        db = get_db()
+        assert not db.in_transaction
+        title = db.execute('SELECT title FROM post WHERE id = 1').fetchone()[0]
+        assert title == 'test title'
+
+# DATABASE puede ser una URI: los tests usan una bd en memoria compartida
+# entre las conexiones del pool
+def test_connect_memory_uri(app):
+    if not app.config['DATABASE'].startswith('file:'):
+        pytest.skip('con --db=file la bd es un fichero')
+
+    with app.app_context():
+        get_db().execute("INSERT INTO post (title, body, author_id) VALUES ('m', '', 1)")
+        get_db().commit()
+
+    def other_thread(result):
+        with app.app_context():
+            result.append(get_db().execute('SELECT COUNT(*) FROM post').fetchone()[0])
+
+    result = []
+    thread = threading.Thread(target=other_thread, args=(result,))
+    thread.start()
+    thread.join()
+    assert result == [2]
+
+# las conexiones de lectura no pueden escribir
+def test_read_db_is_read_only(app):
+    with app.app_context():
+        db = get_read_db()
+        assert db is get_read_db() and db is not get_db()
+        assert db.execute('PRAGMA query_only').fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            db.execute("INSERT INTO post (title, body, author_id) VALUES ('x', '', 1)")
+
+        get_write_db().execute("UPDATE post SET title = 'nuevo'")
+        get_write_db().commit()
+        assert db.execute('SELECT title FROM post').fetchone()[0] == 'nuevo'
+
+# las vistas GET solo usan el pool de lectura
+def test_get_views_use_read_pool(app, client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    for path in ('/', '/search?q=test', '/u/test', '/api/posts', '/enlaces/'):
+        assert client.get(path).status_code == 200
+    assert get_pool(app).stats()['opened'] == 0
+    assert get_pool(app, 'read').stats()['opened'] == 1
+
+# READ_DATABASE manda las lecturas a otro fichero (una réplica)
+@pytest.mark.file_db
+def test_read_database(app, tmp_path):
+    replica = str(tmp_path / 'replica.sqlite')
+    with app.app_context():
+        get_db().execute(f"VACUUM INTO '{replica}'")
+    app.config['READ_DATABASE'] = replica
+
+    with app.app_context():
+        get_db().execute('DELETE FROM post')
+        get_db().commit()
+        assert get_read_db().execute('SELECT COUNT(*) FROM post').fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            get_read_db().execute('DELETE FROM post')
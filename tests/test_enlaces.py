@@ -0,0 +1,140 @@
+import gc
+import weakref
+
+import pytest
+from flaskr.db import get_db
+from flaskr.cache import get_cache
+from flaskr.enlaces import (
+    ClickBuffer, add_enlace, canonicalize_url, decode_code, encode_code,
+    find_enlace
+)
+
+
+@pytest.mark.parametrize(('url', 'canonical'), (
+    ('HTTP://Example.COM', 'http://example.com/'),
+    ('example.com/a/', 'http://example.com/a'),
+    ('https://example.com:443/a?b=2&a=1#frag', 'https://example.com/a?a=1&b=2'),
+    ('http://example.com:8080/', 'http://example.com:8080/'),
+    ('https://example.com/?utm_source=x&id=3&fbclid=y', 'https://example.com/?id=3'),
+    ('https://bücher.de/', 'https://xn--bcher-kva.de/'),
+))
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url) == canonical
+
+@pytest.mark.parametrize('url', ('ftp://example.com/', 'http://', 'javascript:alert(1)'))
+def test_canonicalize_invalid_url(url):
+    with pytest.raises(ValueError):
+        canonicalize_url(url)
+
+# la misma URL escrita de otra forma se fusiona con la que ya existía
+def test_add_enlace_merges_duplicates(app):
+    with app.app_context():
+        db = get_db()
+        id, nuevo = add_enlace(db, 'https://example.com/post?utm_medium=x', 1)
+        assert nuevo
+        assert add_enlace(db, 'HTTPS://EXAMPLE.com/post/', 2) == (id, False)
+        db.commit()
+
+        enlace = find_enlace(db, 'https://example.com/post')
+        assert enlace['id'] == id
+        assert enlace['compartido'] == 2
+        assert enlace['url_enlace'] == 'https://example.com/post?utm_medium=x'
+        assert db.execute('SELECT COUNT(*) FROM enlaces').fetchone()[0] == 1
+
+def test_create(app, client):
+    app.config['WTF_CSRF_ENABLED'] = False
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    assert client.get('/enlaces/create').status_code == 200
+    response = client.post('/enlaces/create', data={'url': 'example.com'})
+    assert response.headers['Location'] == '/enlaces/'
+    response = client.post('/enlaces/create', data={'url': 'http://example.com/'})
+    assert b'ya estaba compartido' in client.get('/enlaces/').data
+
+    response = client.post('/enlaces/create', data={'url': 'ftp://x'})
+    assert b'URL no v' in response.data
+
+    with app.app_context():
+        assert get_db().execute('SELECT COUNT(*) FROM enlaces').fetchone()[0] == 1
+
+def test_index_bad_cursor(client):
+    assert client.get(
+        '/enlaces/?before=2019-01-01 00:00:00,99999999999999999999'
+    ).status_code == 400
+
+def test_create_login_required(client):
+    response = client.post('/enlaces/create')
+    assert response.headers['Location'] == '/auth/login'
+
+@pytest.mark.parametrize(('id', 'code'), (
+    (0, '0'), (1, '1'), (61, 'Z'), (62, '10'), (2 ** 63 - 1, 'aZl8N0y58M7'),
+))
+def test_base62(id, code):
+    assert encode_code(id) == code
+    assert decode_code(code) == id
+
+@pytest.mark.parametrize('code', ('', '01', 'a-b', 'x' * 12, 'aZl8N0y58M8', 'Z' * 11))
+def test_decode_invalid_code(code):
+    with pytest.raises(ValueError):
+        decode_code(code)
+
+# un código que no cabe en un INTEGER de sqlite es un 404, no un 500
+def test_short_link_overflow(client):
+    assert client.get('/l/' + 'Z' * 11).status_code == 404
+
+# la redirección sale de la caché y los clics se escriben sumados al vaciar
+# el buffer
+def test_short_link_redirect(app, client):
+    with app.app_context():
+        db = get_db()
+        id, nuevo = add_enlace(db, 'https://example.com/a?utm_source=x', 1)
+        db.commit()
+    code = encode_code(id)
+
+    for i in range(3):
+        response = client.get(f'/l/{code}')
+        assert response.status_code == 302
+        assert response.headers['Location'] == 'https://example.com/a'
+    assert get_cache('short_links', app).hits == 2
+    assert client.get('/l/zz').status_code == 404
+    assert client.get('/l/0a').status_code == 404
+
+    clicks = app.extensions['flaskr.clicks']
+    assert clicks.pending() == 3
+    assert clicks.flush() == 3
+    assert clicks.flush() == 0
+    with app.app_context():
+        assert get_db().execute(
+            'SELECT clicks FROM enlaces WHERE id = ?', (id,)
+        ).fetchone()[0] == 3
+    assert f'/l/{code}'.encode() in client.get('/enlaces/').data
+
+def test_click_buffer_thread(app):
+    with app.app_context():
+        db = get_db()
+        id, nuevo = add_enlace(db, 'https://example.com/', 1)
+        db.commit()
+
+    clicks = ClickBuffer(app.config, interval=0.01)
+    clicks.add(id, 5)
+    clicks.add(id)
+    clicks.stop()
+    assert clicks.stats() == {'pending': 0, 'flushed': 6, 'flushes': clicks.flushes}
+    with app.app_context():
+        assert get_db().execute(
+            'SELECT clicks FROM enlaces WHERE id = ?', (id,)
+        ).fetchone()[0] == 6
+
+# el hook de salida no mantiene vivas las apps que ya no se usan
+def test_click_buffers_not_kept_alive(app):
+    from flaskr import create_app
+    from flaskr.enlaces import _click_buffers
+
+    other = create_app({'TESTING': True, 'DATABASE': app.config['DATABASE'],
+                        'TEMPLATE_BYTECODE_CACHE': None})
+    clicks = weakref.ref(other.extensions['flaskr.clicks'])
+    assert clicks() in _click_buffers
+    del other
+    gc.collect()
+    assert clicks() is None
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+from flaskr.hashing import HashingBusy, HashingService, HashingTimeout
+
+
+def test_hash_and_verify():
+    service = HashingService('pbkdf2:sha256:1000')
+    pwhash = service.hash('secreto')
+    assert pwhash.startswith('pbkdf2:sha256:1000$')
+    assert service.verify(pwhash, 'secreto')
+    assert not service.verify(pwhash, 'otro')
+
+def test_needs_rehash():
+    service = HashingService('pbkdf2:sha256:1000')
+    assert not service.needs_rehash(service.hash('x'))
+    assert service.needs_rehash(HashingService('pbkdf2:sha256:2000').hash('x'))
+    # 'scrypt' sin parámetros equivale a los de Werkzeug por defecto
+    assert not HashingService('scrypt').needs_rehash(
+        HashingService('scrypt:32768:8:1').hash('x')
+    )
+
+# con el pool y la cola llenos se rechaza al momento con un 429
+def test_load_shedding():
+    service = HashingService('pbkdf2:sha256:1000', workers=0, queue_size=0)
+    service._slots.acquire()
+    with pytest.raises(HashingBusy) as e:
+        service.hash('x')
+    assert e.value.code == 429
+    service._slots.release()
+    assert service.hash('x')
+
+def test_process_pool():
+    service = HashingService('pbkdf2:sha256:1000', workers=1)
+    try:
+        assert service.verify(service.hash('secreto'), 'secreto')
+    finally:
+        service.shutdown()
+
+# un hash que tarda más que el timeout es un 503, y su hueco sigue ocupado
+# hasta que termina de verdad
+def test_timeout_keeps_slot():
+    service = HashingService('pbkdf2:sha256:1000', workers=1, queue_size=0, timeout=0.2)
+    try:
+        with pytest.raises(HashingTimeout) as e:
+            service._run(time.sleep, 2)
+        assert e.value.code == 503
+        with pytest.raises(HashingBusy):
+            service.hash('x')
+    finally:
+        service.shutdown()
+    assert service._slots.acquire(blocking=False)
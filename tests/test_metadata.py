@@ -0,0 +1,122 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from flaskr.db import get_db
+from flaskr.enlaces import add_enlace
+from flaskr.metadata import fetch_page, parse_metadata
+
+PAGE = '''<!DOCTYPE html>
+<html><head>
+<meta charset="utf-8">
+<title>
+  Página   de prueba
+</title>
+<meta name="description" content="Una descripción">
+<link rel="shortcut icon" href="/static/icon.png">
+</head><body><title>otro</title></body></html>
+'''
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''Servidor de prueba: /page con ETag, /missing da 404 y /image no es HTML.'''
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/page':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = PAGE.encode('utf8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('ETag', '"v1"')
+        elif self.path == '/image':
+            body = b'\x89PNG'
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+        else:
+            body = b'no'
+            self.send_response(404)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    StubHandler.requests = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_parse_metadata():
+    assert parse_metadata(PAGE, 'https://example.com/a/b') == {
+        'title': 'Página de prueba',
+        'description': 'Una descripción',
+        'favicon': 'https://example.com/static/icon.png',
+    }
+    assert parse_metadata(
+        '<meta property="og:title" content="OG">', 'https://example.com/a'
+    ) == {'title': 'OG', 'description': None, 'favicon': 'https://example.com/favicon.ico'}
+
+def test_fetch_page(server):
+    result = fetch_page(server + '/page', allow_private=True)
+    assert result['status'] == 'ok'
+    assert result['title'] == 'Página de prueba'
+    assert result['etag'] == '"v1"'
+    assert fetch_page(server + '/page', etag='"v1"', allow_private=True) == {
+        'status': 'not_modified'
+    }
+    assert fetch_page(server + '/missing', allow_private=True)['error'] == 'HTTP 404'
+    assert fetch_page(server + '/image', allow_private=True)['status'] == 'error'
+
+# sin METADATA_ALLOW_PRIVATE no se descargan direcciones locales
+def test_fetch_page_private(server):
+    result = fetch_page(server + '/page')
+    assert result['status'] == 'error'
+    assert 'privada' in result['error']
+    assert StubHandler.requests == []
+
+def test_fetch_metadata_command(app, runner, client, server):
+    app.config.update(METADATA_ALLOW_PRIVATE=True, METADATA_HOST_INTERVAL=0)
+    with app.app_context():
+        db = get_db()
+        page, nuevo = add_enlace(db, server + '/page', 1)
+        missing, nuevo = add_enlace(db, server + '/missing', 1)
+        db.commit()
+
+    result = runner.invoke(args=['fetch-metadata', '--once'])
+    assert result.exit_code == 0, result.output
+    assert '2 enlaces: 1 nuevos, 0 sin cambios, 1 errores' in result.output
+    assert 'Página de prueba' in client.get('/enlaces/').get_data(as_text=True)
+
+    with app.app_context():
+        db = get_db()
+        rows = {row['enlace_id']: row for row in db.execute(
+            'SELECT * FROM enlace_metadata'
+        )}
+        assert rows[page]['status'] == 'ok'
+        assert rows[page]['favicon'] == server + '/static/icon.png'
+        assert rows[missing]['status'] == 'error'
+        assert rows[missing]['attempts'] == 1
+        assert rows[page]['next_fetch'] > rows[missing]['next_fetch']
+
+        # nada pendiente hasta que caduca; al caducar se pide condicional
+        assert 'enlaces' not in runner.invoke(args=['fetch-metadata', '--once']).output
+        db.execute(
+            'UPDATE enlace_metadata SET next_fetch = CURRENT_TIMESTAMP'
+            ' WHERE enlace_id = ?', (page,)
+        )
+        db.commit()
+
+    result = runner.invoke(args=['fetch-metadata', '--once'])
+    assert '1 enlaces: 0 nuevos, 1 sin cambios, 0 errores' in result.output
+    assert StubHandler.requests[-1] == ('/page', '"v1"')
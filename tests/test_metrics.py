@@ -0,0 +1,43 @@
+import logging
+
+from flaskr import create_app
+from flaskr.db import get_db
+from flaskr.metrics import get_registry
+
+
+def test_metrics_endpoint(client):
+    client.get('/')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+    text = response.get_data(as_text=True)
+    assert '# TYPE flaskr_request_seconds histogram' in text
+    assert 'flaskr_request_seconds_count{endpoint="blog.index",method="GET"} 1' in text
+    assert 'flaskr_requests_total{endpoint="blog.index",status="200"} 1' in text
+    assert 'flaskr_db_pool{role="read",stat="idle"}' in text
+
+# el index lee la versión del contenido, el post de data.sql y su mes del
+# archivo
+def test_sql_instrumentation(app, client):
+    registry = get_registry(app)
+    rows = registry.sql_rows.value()
+    client.get('/')
+
+    assert registry.sql_rows.value() - rows == 3
+    assert registry.request_statements.count('blog.index') == 1
+    assert registry.sql_statements.value() > 0
+    assert registry.sql_seconds.count() > 0
+
+def test_slow_query_log(app, caplog):
+    app.config['SLOW_QUERY_MS'] = 0
+    with app.app_context():
+        with caplog.at_level(logging.WARNING):
+            get_db().execute('SELECT * FROM post').fetchall()
+
+    assert 'consulta lenta' in caplog.text
+    assert get_registry(app).slow_queries.value() > 0
+
+def test_metrics_disabled():
+    app = create_app({'TESTING': True, 'METRICS_ENABLED': False})
+    assert app.test_client().get('/metrics').status_code == 404
@@ -0,0 +1,74 @@
+import pytest
+from flaskr import create_app
+from flaskr.db import get_db
+from flaskr.models import SqliteUserRegistry, User, UserRegistry
+
+
+def test_user_registry():
+    registry = UserRegistry()
+    user = registry.add(User(1, 'ana', 'Ana@example.com', 'secreto'))
+
+    assert registry.get(1) is user
+    assert registry.get_by_email('ana@example.com') is user
+    assert registry.get_by_username('ana') is user
+    assert registry.get(2) is None
+    assert len(registry) == 1 and 1 in registry
+    assert user.check_password('secreto')
+    assert user.get_id() == '1'
+    assert not hasattr(user, '__dict__')
+
+    # invalidate no borra: este registro es el que guarda los usuarios
+    registry.invalidate(1)
+    assert registry.get(1) is user
+
+    registry.remove(1)
+    assert registry.get_by_email('ana@example.com') is None
+
+@pytest.mark.parametrize(('id', 'name', 'email'), (
+    (1, 'otra', 'otra@example.com'),
+    (2, 'ana', 'otra@example.com'),
+    (2, 'otra', 'ANA@example.com'),
+))
+def test_user_registry_duplicates(id, name, email):
+    registry = UserRegistry()
+    registry.add(User(1, 'ana', 'ana@example.com', 'x'))
+    with pytest.raises(ValueError):
+        registry.add(User(id, name, email, 'x'))
+
+# el registro sqlite lee de la tabla user los usuarios que no conoce
+def test_sqlite_user_registry(app):
+    with app.app_context():
+        registry = SqliteUserRegistry()
+        user = registry.get(1)
+        assert user.name == 'test'
+        assert user.check_password('test')
+        assert registry.get_by_username('test') is user
+        assert registry.get(99) is None
+
+        get_db().execute("UPDATE user SET username = 'nuevo' WHERE id = 1")
+        get_db().commit()
+        assert registry.get_by_username('test') is user
+        registry.invalidate(1)
+        assert registry.get(1).name == 'nuevo'
+        assert registry.get_by_username('test') is None
+        assert registry.get_by_username('nuevo') is registry.get(1)
+
+# como mucho guarda maxsize usuarios
+def test_sqlite_user_registry_maxsize(app):
+    with app.app_context():
+        registry = SqliteUserRegistry(maxsize=1)
+        assert registry.get(1).name == 'test'
+        assert registry.get(2).name == 'other'
+        assert len(registry) == 1
+        assert registry.get_by_username('test').id == 1
+
+def test_load_user(app):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': app.config['DATABASE'],
+        'USER_REGISTRY': 'sqlite',
+    })
+    loader = app.login_manager._user_callback
+    with app.app_context():
+        assert loader('1').name == 'test'
+        assert loader('nope') is None
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+from flaskr.ratelimit import MemoryBackend, RateLimiter, SqliteBackend, account_key
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBackend()
+    return SqliteBackend(str(tmp_path / 'ratelimit.sqlite'))
+
+def test_limit_and_retry_after(backend):
+    # ventana de 60 s, 3 intentos
+    assert [backend.hit('k', 3, 60, 600 + i) for i in range(3)] == [0, 0, 0]
+    wait = backend.hit('k', 3, 60, 610)
+    assert wait > 0
+    # los rechazados no cuentan: pasada la espera vuelve a entrar uno
+    assert backend.hit('k', 3, 60, 610 + wait) == 0
+
+# la ventana anterior cuenta en proporción a lo que queda de ella
+def test_sliding_window(backend):
+    for i in range(4):
+        assert backend.hit('k', 4, 60, 650 + i) == 0
+    # a mitad de la ventana siguiente aún pesan 2 de los 4
+    assert backend.hit('k', 4, 60, 690) == 0
+    assert backend.hit('k', 4, 60, 690) == 0
+    assert backend.hit('k', 4, 60, 690) > 0
+    # dos ventanas después se empieza de cero
+    assert backend.hit('k', 4, 60, 900) == 0
+
+def test_memory_eviction():
+    backend = MemoryBackend(max_keys=2)
+    for key in 'abc':
+        backend.hit(key, 5, 60, 0)
+    assert len(backend) == 2 and backend.evictions == 1
+    # las que llevan más de una ventana sin usarse se quitan solas
+    backend.hit('d', 5, 60, 200)
+    assert len(backend) == 1 and backend.evictions == 3
+
+def test_account_limit():
+    limiter = RateLimiter(MemoryBackend(), per_ip=10, per_account=2)
+    assert limiter.hit('login', '1.1.1.1', 'Test', now=0) == 0
+    assert limiter.hit('login', '2.2.2.2', 'test ', now=0) == 0
+    assert limiter.hit('login', '3.3.3.3', 'TEST', now=0) > 0
+    assert limiter.hit('login', '3.3.3.3', 'otro', now=0) == 0
+    assert limiter.stats()['rejected'] == 1
+
+# un email enorme no ocupa más que uno normal
+def test_account_key_is_bounded():
+    backend = MemoryBackend()
+    limiter = RateLimiter(backend)
+    limiter.hit('login', '1.1.1.1', 'x' * 400000, now=0)
+    assert max(len(key) for key in backend._data) < 100
+    assert account_key(' Test ') == account_key('test')
+    assert account_key('test') != account_key('otro')
+
+# en el registro se deja el email vacío para que no haga falta email_validator
+@pytest.mark.parametrize(('path', 'email'), (
+    ('/auth/login', 'test'),
+    ('/auth/register', ''),
+))
+def test_view_rejects_before_hashing(app, client, monkeypatch, path, email):
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.extensions['flaskr.ratelimit'].per_ip = 2
+    calls = []
+    monkeypatch.setattr(
+        'flaskr.hashing.HashingService._run', lambda self, *args: calls.append(args)
+    )
+    data = {'email': email, 'username': 'x', 'password': 'x'}
+    for i in range(2):
+        assert client.post(path, data=data).status_code != 429
+    hashed = len(calls)
+
+    response = client.post(path, data=data)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
+    assert len(calls) == hashed
+    # los GET no se limitan
+    assert client.get(path).status_code == 200
+
+def test_metrics(app, client):
+    app.config['WTF_CSRF_ENABLED'] = False
+    client.post('/auth/login', data={'email': 'test', 'password': 'x'})
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'flaskr_ratelimit{stat="checks"} 1' in text
+
+def test_disabled(app):
+    from flaskr import create_app
+    app = create_app({'TESTING': True, 'RATELIMIT_ENABLED': False,
+                      'DATABASE': app.config['DATABASE'],
+                      'TEMPLATE_BYTECODE_CACHE': None})
+    assert 'flaskr.ratelimit' not in app.extensions
+
+# los contadores no pierden incrementos con varios hilos a la vez
+def test_counters_thread_safe():
+    limiter = RateLimiter(MemoryBackend(), per_ip=10 ** 6)
+    threads = [
+        threading.Thread(target=lambda: [
+            limiter.hit('login', '1.1.1.1', now=0) for _ in range(2000)
+        ])
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.stats()['checks'] == 8000
@@ -0,0 +1,48 @@
+from flaskr.rendering import (
+    RENDERER_VERSION, make_excerpt, render_inline, render_markdown,
+    rendered_columns
+)
+
+def test_render_escapes_html():
+    html = render_markdown('hola <script>alert(1)</script>')
+    assert '<script>' not in html
+    assert '&lt;script&gt;' in html
+
+def test_render_inline():
+    assert render_inline('**a** y *b*') == '<strong>a</strong> y <em>b</em>'
+    assert render_inline('`<b>*x*</b>`') == '<code>&lt;b&gt;*x*&lt;/b&gt;</code>'
+    assert render_inline('[web](https://example.com/?a=1&b=2)') == (
+        '<a href="https://example.com/?a=1&amp;b=2" rel="nofollow">web</a>'
+    )
+    # solo enlaces http(s) o relativos
+    assert '<a' not in render_inline('[x](javascript:alert(1))')
+    assert '<a' not in render_inline('[x](https://a.com/" onclick="y)')
+    assert '<a' not in render_inline('[x](//evil.com)')
+    assert '<a' not in render_inline('[x](/\\evil.com)')
+
+# el texto no puede colarse entre los marcadores de los códigos
+def test_render_inline_nul():
+    assert render_inline('x \x001\x00 y') == 'x 1 y'
+    assert render_inline('`a` \x000\x00') == '<code>a</code> 0'
+
+def test_render_blocks():
+    html = render_markdown(
+        '## Título\n\nuno\ndos\n\n- a\n- b\n\n1. c\n\n> cita\n\n```\n<p>*x*</p>\n```'
+    )
+    assert html.split('\n') == [
+        '<h2>Título</h2>',
+        '<p>uno<br>',
+        'dos</p>',
+        '<ul><li>a</li><li>b</li></ul>',
+        '<ol><li>c</li></ol>',
+        '<blockquote><p>cita</p></blockquote>',
+        '<pre><code>&lt;p&gt;*x*&lt;/p&gt;</code></pre>',
+    ]
+
+def test_make_excerpt():
+    assert make_excerpt('# Hola\n\n**mundo** [web](https://a.com)') == 'Hola mundo web'
+    excerpt = make_excerpt('palabra ' * 100, length=20)
+    assert excerpt == 'palabra palabra…'
+
+def test_rendered_columns():
+    assert rendered_columns('*x*') == ('<p><em>x</em></p>', 'x', RENDERER_VERSION)
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+from jinja2 import FileSystemBytecodeCache
+
+# create_app no importa los módulos que solo usan las órdenes de consola
+def test_cli_modules_not_imported():
+    code = (
+        'import sys; from flaskr import create_app;'
+        " create_app({'TESTING': True, 'TEMPLATE_BYTECODE_CACHE': None});"
+        " print(sorted(m for m in ('flaskr.bulk', 'flaskr.metadata', 'asyncio')"
+        ' if m in sys.modules))'
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == '[]'
+
+def test_lazy_command_help(runner):
+    result = runner.invoke(args=['--help'])
+    assert 'fetch-metadata' in result.output
+    result = runner.invoke(args=['export-posts', '--help'])
+    assert result.exit_code == 0
+    assert '--format' in result.output
+    assert 'export-posts export-posts' not in result.output
+    # los errores de uso tampoco repiten el nombre de la orden
+    result = runner.invoke(args=['import-posts'])
+    assert result.exit_code == 2
+    assert 'import-posts [OPTIONS] FILE' in result.output
+    assert 'import-posts import-posts' not in result.output
+
+def test_compile_templates(app, runner, tmp_path):
+    result = runner.invoke(args=['compile-templates'])
+    assert 'desactivado' in result.output
+
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(str(tmp_path))
+    result = runner.invoke(args=['compile-templates'])
+    count = len(app.jinja_env.list_templates())
+    assert f'Compiladas {count} plantillas' in result.output
+    assert len(list(tmp_path.iterdir())) == count
+
+def test_startup_profile(runner):
+    result = runner.invoke(args=['startup-profile', '--path', '/hello', '--top', '3'])
+    assert result.exit_code == 0, result.output
+    assert 'flaskr.blog' in result.output
+    assert 'first_request:' in result.output
+    assert 'status de /hello: 200' in result.output
@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from flaskr.db import get_db
+from flaskr.writer import WriteQueue, WriteTimeout, write
+
+def insert_post(db, title):
+    return db.execute(
+        "INSERT INTO post (title, body, author_id) VALUES (?, '', 1)", (title,)
+    ).lastrowid
+
+def fail(db):
+    insert_post(db, 'no')
+    raise ValueError('fallo')
+
+@pytest.fixture
+def writer(app):
+    writer = WriteQueue(app.config, max_batch=50, max_delay=100)
+    yield writer
+    writer.shutdown()
+
+# las operaciones que llegan juntas van en una sola transacción y la que
+# falla se deshace sin llevarse las demás
+def test_write_queue_batches(app, writer):
+    futures = [writer.submit(insert_post, f'post {i}') for i in range(20)]
+    failed = writer.submit(fail)
+    ids = [future.result(5) for future in futures]
+    with pytest.raises(ValueError):
+        failed.result(5)
+
+    assert len(set(ids)) == 20
+    assert writer.batches < 20
+    assert writer.stats()['operations'] == 21
+    with app.app_context():
+        titles = [row[0] for row in get_db().execute('SELECT title FROM post')]
+        assert len(titles) == 21 and 'no' not in titles
+
+def test_write_queue_shutdown(app, writer):
+    future = writer.submit(insert_post, 'último')
+    writer.shutdown()
+    assert future.done()
+    # se vuelve a arrancar con la siguiente escritura
+    assert writer.run(insert_post, 'otro', timeout=5) > 0
+
+# lo que sigue en cola al pasar el timeout se cancela y no se escribe; lo
+# que ya se está escribiendo se espera
+def test_write_queue_timeout(app, writer):
+    release = threading.Event()
+    blocked = writer.submit(lambda db: release.wait(5))
+    with pytest.raises(WriteTimeout) as e:
+        writer.run(insert_post, 'tarde', timeout=0.05)
+    assert e.value.code == 503
+    release.set()
+    blocked.result(5)
+
+    # el lote sale a los 100 ms (max_delay) y la operación tarda 400
+    def slow(db):
+        time.sleep(0.4)
+        return insert_post(db, 'lento')
+    assert writer.run(slow, timeout=0.2) > 0
+
+    writer.shutdown()
+    with app.app_context():
+        titles = [row[0] for row in get_db().execute('SELECT title FROM post')]
+        assert titles == ['test title', 'lento']
+
+def test_write_without_queue(app):
+    with app.app_context():
+        id = write(insert_post, 'directo')
+        with pytest.raises(ValueError):
+            write(fail)
+        get_db().rollback()
+        titles = [row[0] for row in get_db().execute('SELECT title FROM post')]
+        assert titles == ['test title', 'directo']
+        assert id == 2
+
+def test_create_through_queue(app, client, writer):
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.extensions['flaskr.writer'] = writer
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    response = client.post('/create', data={'title': 'en cola', 'content': 'x'})
+    assert response.headers['Location'] == '/'
+    response = client.post('/enlaces/create', data={'url': 'example.com'})
+    assert response.headers['Location'] == '/enlaces/'
+    assert writer.stats()['operations'] == 2
+
+    assert b'en cola' in client.get('/').data
+    assert b'example.com' in client.get('/enlaces/').data
+    assert b'flaskr_write_queue{stat="operations"} 2' in client.get('/metrics').data